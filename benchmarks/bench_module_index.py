@@ -0,0 +1,60 @@
+#coding=utf-8
+# Compare the previous pkgutil.iter_modules() scan with utils.InstalledIndex on a synthetic site-packages.
+# Usage: python benchmarks/bench_module_index.py [--dists 5000] [--lookups 6]
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import utils
+from fixtures import make_site_packages
+
+
+def legacy_module_exists(module_name):
+    from pkgutil import iter_modules
+    return module_name in (name for loader, name, ispkg in iter_modules())
+
+
+def timed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--dists", type=int, default=5000)
+    parser.add_argument("--lookups", type=int, default=6, help="module_exists calls per installer run.")
+    args = parser.parse_args()
+
+    site_dir = tempfile.mkdtemp(prefix="bench-site-")
+    try:
+        make_site_packages(site_dir, args.dists)
+        sys.path.insert(0, site_dir)
+        names = ["fakepkg{0}".format(args.dists - 1), "jupyter", "matplotlib", "pandas", "onnxmltools", "winmltools"]
+        lookups = [names[i % len(names)] for i in range(args.lookups)]
+
+        legacy = timed(lambda: [legacy_module_exists(name) for name in lookups])
+        index = utils.InstalledIndex()
+        build = timed(lambda: index.version(lookups[0]))
+        lookup = timed(lambda: [index.version(name) for name in lookups])
+        # One new distribution, as after a successful pip install.
+        os.makedirs(os.path.join(site_dir, "newpkg-2.0.dist-info"))
+        invalidate = timed(index.invalidate)
+        assert index.version("newpkg") == "2.0"
+
+        print("distributions: {0}, lookups: {1}".format(args.dists, args.lookups))
+        print("legacy iter_modules: {0:.4f}s".format(legacy))
+        print("index build:         {0:.4f}s".format(build))
+        print("index lookups:       {0:.6f}s".format(lookup))
+        print("index invalidate:    {0:.4f}s".format(invalidate))
+        print("speedup:             {0:.1f}x".format(legacy / (build + lookup)))
+    finally:
+        shutil.rmtree(site_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#coding=utf-8
+# Compare utils._unzip_file against the previous member-by-member extraction on a synthetic many-member zip.
+# Usage: python benchmarks/bench_unzip.py [--members 4000] [--size 65536] [--workers N]
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+import utils
+from fixtures import make_zip
+
+
+def legacy_unzip(file_path, target_dir):
+    with zipfile.ZipFile(file_path) as zip_file:
+        if not os.path.isdir(target_dir):
+            os.makedirs(target_dir)
+        for names in zip_file.namelist():
+            zip_file.extract(names, target_dir)
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--members", type=int, default=4000)
+    parser.add_argument("--size", type=int, default=64 * 1024)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="bench-unzip-")
+    try:
+        zip_path = os.path.join(work_dir, "payload.zip")
+        make_zip(zip_path, args.members, args.size)
+        legacy = timed(legacy_unzip, zip_path, os.path.join(work_dir, "legacy"))
+        parallel = timed(utils._unzip_file, zip_path, os.path.join(work_dir, "parallel"), args.workers)
+        print("members: {0}, member size: {1} bytes, archive: {2:.1f} MB".format(
+            args.members, args.size, os.path.getsize(zip_path) / (1024 * 1024)))
+        print("legacy:   {0:.3f}s".format(legacy))
+        print("parallel: {0:.3f}s ({1:.2f}x)".format(parallel, legacy / parallel))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
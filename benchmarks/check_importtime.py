@@ -0,0 +1,59 @@
+#coding=utf-8
+# Startup regression check: imports main with python -X importtime and fails when the import takes longer than
+# the budget, or when a module that must stay lazy is imported at startup.
+# Usage: python benchmarks/check_importtime.py [--budget-ms 80] [--runs 5]
+import argparse
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+
+# Only needed by some commands or platforms, see the function level imports in utils.py and install_pkg.py.
+LAZY_MODULES = ["yaml", "argparse", "ctypes", "subprocess", "pickle", "zipfile", "tarfile", "tempfile",
+                "urllib.request", "ssl", "http.client", "http_pool", "asyncio", "runner", "bundle", "staged_tree"]
+
+
+def import_times(module):
+    # Returns {module: cumulative microseconds} of one fresh interpreter importing module.
+    p = subprocess.run([sys.executable, "-X", "importtime", "-c", "import {0}".format(module)], cwd=REPO_DIR,
+                       stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if p.returncode != 0:
+        raise RuntimeError(p.stderr)
+    times = {}
+    for line in p.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--budget-ms", type=float, default=80.0, help="maximum cumulative import time of --module.")
+    parser.add_argument("--runs", type=int, default=5, help="the best of these runs is compared to the budget.")
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [import_times(args.module) for _ in range(args.runs)]
+    best = min(runs, key=lambda times: times[args.module])
+    total_ms = best[args.module] / 1000.0
+    print("import {0}: {1:.1f}ms (budget {2:.1f}ms, best of {3})".format(args.module, total_ms, args.budget_ms, args.runs))
+    for name, cumulative in sorted(best.items(), key=lambda item: -item[1])[1:args.top + 1]:
+        print("  {0:>8.1f}ms  {1}".format(cumulative / 1000.0, name))
+
+    failures = []
+    eager = [name for name in LAZY_MODULES if name in best]
+    if eager:
+        failures.append("imported at startup: {0}".format(", ".join(eager)))
+    if total_ms > args.budget_ms:
+        failures.append("import time {0:.1f}ms exceeds the budget of {1:.1f}ms".format(total_ms, args.budget_ms))
+    for failure in failures:
+        print("FAIL: {0}".format(failure))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+#coding=utf-8
+# Plan regression check: builds the install plan of config/config.yaml for known targets and fails when a
+# package is missing or resolves to another name or version than expected.
+# Usage: python benchmarks/check_plan.py
+import os
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from init import TOOLSFORAI_OS_LINUX, TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_MACOS
+import install_plan
+import pkg_config
+
+# (os, gpu, cuda, python) -> {group: [(name, version)]} that the plan must contain for the group.
+EXPECTED = [
+    ((TOOLSFORAI_OS_MACOS, True, None, "36"), {
+        "tensorflow": [("tensorflow-gpu", "1.5.0")],
+        "mxnet": [("mxnet-cu90", "1.1.0.post0")],
+        "cntk": [("cntk-gpu", "2.5.1")],
+    }),
+    ((TOOLSFORAI_OS_MACOS, False, None, "36"), {
+        "tensorflow": [("tensorflow", "1.5.0")],
+        "mxnet": [("mxnet", "1.1.0.post0")],
+    }),
+    ((TOOLSFORAI_OS_LINUX, True, "8.0", "36"), {
+        "tensorflow": [("tensorflow-gpu", "1.4.1")],
+        "mxnet": [("mxnet-cu80", "1.1.0.post0")],
+        "chainer": [("cupy-cuda80", ">=4.0.0"), ("chainer", "4.0.0")],
+    }),
+    ((TOOLSFORAI_OS_LINUX, True, "9.2", "36"), {
+        "tensorflow": [("tensorflow-gpu", "1.5.0")],
+        "chainer": [("cupy", ">=4.0.0"), ("chainer", "4.0.0")],
+    }),
+    ((TOOLSFORAI_OS_WIN, True, "9.0", "36"), {
+        "tensorflow": [("tensorflow-gpu", "1.5.0")],
+        "chainer": [("cupy", ">=4.0.0"), ("chainer", "4.0.0")],
+    }),
+]
+
+
+def main():
+    config = pkg_config.load_config(os.path.join(REPO_DIR, "config", "config.yaml"), use_cache=False)
+    failures = []
+    for target, groups in EXPECTED:
+        plan = install_plan.build_plan(config, *target)
+        for group, expected in groups.items():
+            entries = [(entry.name, entry.version) for entry in plan if entry.group == group]
+            for package in expected:
+                if package not in entries:
+                    failures.append("{0}: {1} has {2}, expected {3}".format(target, group, entries, package))
+    for failure in failures:
+        print(failure)
+    print("{0} targets checked, {1} failures".format(len(EXPECTED), len(failures)))
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
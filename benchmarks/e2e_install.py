@@ -0,0 +1,209 @@
+#coding=utf-8
+# Hermetic end-to-end run of main.py: a local mirror (PEP 503 simple index of stub wheels, stub wheel URLs and a
+# stub CNTK archive) is served over HTTP, and the installer runs with --base-url pointing at it in a throwaway
+# venv and home directory. Nothing is fetched from the network.
+# Usage: python benchmarks/e2e_install.py [--python python3.6] [--output result.json] [--keep] [-- --jobs 4 --batch]
+import argparse
+import html
+import importlib.metadata
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+sys.path.insert(0, REPO_DIR)
+from init import TOOLSFORAI_OS_LINUX, TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_MACOS
+from init import SysInfo
+import fixtures
+import install_pkg
+import install_plan
+import pkg_config
+
+# Version of stub wheels for packages config.yaml does not pin.
+STUB_VERSION = "1.0"
+# Every GPU/CUDA combination, so that the mirror serves whatever the installer detects.
+VARIANTS = [(False, None), (True, "8.0"), (True, "9.0"), (True, None)]
+
+
+def host_os():
+    if sys.platform == "win32":
+        return TOOLSFORAI_OS_WIN
+    if sys.platform == "darwin":
+        return TOOLSFORAI_OS_MACOS
+    return TOOLSFORAI_OS_LINUX
+
+
+def python_tag(python):
+    # e.g. "36", the SysInfo.python of the venv.
+    return subprocess.check_output([python, "-c", "import sys; print('%d%d' % sys.version_info[:2])"],
+                                   universal_newlines=True).strip()
+
+
+def _unsupported_wheel(url, python):
+    # Wheel URLs of config.yaml have a cpXYm ABI tag, which only exists before Python 3.8.
+    return url.endswith(".whl") and "m-" in url.rsplit("/", 1)[-1] and int(python) >= 38
+
+
+def build_mirror(mirror_dir, os_name, python, target, cntk_members):
+    # Writes the stub mirror of every GPU/CUDA variant, returns (index packages, URL files, groups of the target
+    # (gpu, cuda) that can not be installed from it).
+    config = pkg_config.load_config(os.path.join(REPO_DIR, "config", "config.yaml"), use_cache=False)
+    packages_dir = os.path.join(mirror_dir, "packages")
+    os.makedirs(packages_dir)
+    index = {}
+    url_files = set()
+    unsupported = set()
+    for gpu, cuda in VARIANTS:
+        for entry in install_plan.build_plan(config, os_name, gpu, cuda, python):
+            if entry.skip:
+                continue
+            if entry.source and (not re.match(r"https?://", entry.source) or _unsupported_wheel(entry.source, python)):
+                # VCS sources are not mirrored, wheels of another Python can not be installed.
+                if (gpu, cuda) == target:
+                    unsupported.add(entry.group)
+            elif entry.source:
+                path = install_plan.mirror_url(entry.source, mirror_dir)
+                if path not in url_files:
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    fixtures.make_wheel(os.path.dirname(path), entry.name, entry.version or STUB_VERSION,
+                                        file_name=os.path.basename(path))
+                    url_files.add(path)
+            else:
+                version = entry.version or STUB_VERSION
+                project = re.sub(r"[-_.]+", "-", entry.name).lower()
+                if version not in index.setdefault(project, {}):
+                    index[project][version] = os.path.basename(fixtures.make_wheel(packages_dir, entry.name, version))
+
+    simple_dir = os.path.join(mirror_dir, "simple")
+    os.makedirs(simple_dir)
+    for project, versions in index.items():
+        os.makedirs(os.path.join(simple_dir, project))
+        with open(os.path.join(simple_dir, project, "index.html"), 'w') as fout:
+            fout.write("<!DOCTYPE html>\n<html><body>\n")
+            for file_name in sorted(versions.values()):
+                fout.write('<a href="../../packages/{0}">{0}</a><br/>\n'.format(html.escape(file_name)))
+            fout.write("</body></html>\n")
+    with open(os.path.join(simple_dir, "index.html"), 'w') as fout:
+        fout.write("<!DOCTYPE html>\n<html><body>\n")
+        for project in sorted(index):
+            fout.write('<a href="{0}/">{0}</a><br/>\n'.format(project))
+        fout.write("</body></html>\n")
+
+    if os_name in (TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_LINUX):
+        SysInfo.os = os_name
+        for gpu, cuda in VARIANTS:
+            SysInfo.gpu, SysInfo.cuda = gpu, cuda
+            ver, _, cntk_url = install_pkg.cntk_archive()
+            path = install_plan.mirror_url(cntk_url, mirror_dir)
+            if path not in url_files:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fixtures.make_cntk_archive(path, "CNTK-{0}".format(ver.replace('.', '-')), cntk_members, 16 * 1024)
+                url_files.add(path)
+    return index, url_files, unsupported
+
+
+def make_venv(venv_dir, python):
+    # A venv with only the installer's own dependency PyYAML, copied from this interpreter since there is no index
+    # to install it from. With --python of another Python version, its pure Python fallback is used.
+    subprocess.check_call([python, "-m", "venv", venv_dir])
+    if sys.platform == "win32":
+        venv_python = os.path.join(venv_dir, "Scripts", "python.exe")
+    else:
+        venv_python = os.path.join(venv_dir, "bin", "python")
+    site_dir = subprocess.check_output([venv_python, "-c", "import sysconfig; print(sysconfig.get_paths()['platlib'])"],
+                                       universal_newlines=True).strip()
+    distribution = importlib.metadata.distribution("PyYAML")
+    for file in distribution.files:
+        if file.parts[0] == ".." or file.suffix == ".pyc":
+            continue
+        path = os.path.join(site_dir, *file.parts)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.copyfile(str(distribution.locate_file(file)), path)
+    return venv_python
+
+
+def detect_target(venv_python, env):
+    # (gpu, cuda) the installer detects in the venv, written to the snapshot it reuses unless --refresh-detect.
+    code = "import utils; from init import SysInfo; utils.detect_system(True); print(SysInfo.gpu, SysInfo.cuda)"
+    output = subprocess.check_output([venv_python, "-c", code], cwd=REPO_DIR, env=env, universal_newlines=True)
+    gpu, cuda = output.strip().splitlines()[-1].split()
+    return gpu == "True", None if cuda == "None" else cuda
+
+
+def hermetic_env(home_dir):
+    # The installer writes to ~/.toolsforai, ~/.bashrc and %APPDATA%, all of them go to home_dir.
+    env = dict(os.environ)
+    for name in ("HOME", "USERPROFILE"):
+        env[name] = home_dir
+    env["APPDATA"] = os.path.join(home_dir, "AppData", "Roaming")
+    os.makedirs(env["APPDATA"])
+    open(os.path.join(home_dir, ".bashrc"), 'a').close()
+    env["PIP_DISABLE_PIP_VERSION_CHECK"] = "1"
+    env["PIP_CONFIG_FILE"] = os.devnull
+    for name in ("PIP_INDEX_URL", "PIP_EXTRA_INDEX_URL", "PIP_FIND_LINKS", "PYTHONPATH"):
+        env.pop(name, None)
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--python", default=sys.executable, help="interpreter of the throwaway venv.")
+    parser.add_argument("--cntk-members", type=int, default=200, help="files in the stub CNTK archive.")
+    parser.add_argument("--output", help="write exit code, duration and the installer summary as JSON to this file.")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory (mirror, venv, home).")
+    parser.add_argument("installer_args", nargs=argparse.REMAINDER,
+                        help="arguments after -- are passed to main.py, e.g. -- --jobs 4 --batch.")
+    args = parser.parse_args()
+    installer_args = [arg for arg in args.installer_args if arg != "--"]
+
+    os_name = host_os()
+    python = python_tag(args.python)
+    work_dir = tempfile.mkdtemp(prefix="toolsforai-e2e-")
+    try:
+        mirror_dir = os.path.join(work_dir, "mirror")
+        home_dir = os.path.join(work_dir, "home")
+        os.makedirs(home_dir)
+        env = hermetic_env(home_dir)
+        venv_python = make_venv(os.path.join(work_dir, "venv"), args.python)
+        target = detect_target(venv_python, env)
+        index, url_files, unsupported = build_mirror(mirror_dir, os_name, python, target, args.cntk_members)
+        print("Mirror: {0} index projects, {1} URL files in {2}".format(len(index), len(url_files), mirror_dir))
+
+        if unsupported and "--exclude" not in installer_args and "--only" not in installer_args:
+            print("Exclude {0}, not installable from the mirror on Python {1}.".format(", ".join(sorted(unsupported)), python))
+            installer_args += ["--exclude", ",".join(sorted(unsupported))]
+        summary_path = os.path.join(work_dir, "summary.json")
+        with fixtures.serve_directory(mirror_dir) as base_url:
+            cmd = [venv_python, os.path.join(REPO_DIR, "main.py"), "--base-url", base_url, "--non-interactive",
+                   "--summary", summary_path] + installer_args
+            print("Running {0}".format(" ".join(cmd)))
+            start = time.perf_counter()
+            returncode = subprocess.call(cmd, env=env, stdin=subprocess.DEVNULL)
+            duration = time.perf_counter() - start
+
+        with open(summary_path) as fin:
+            summary = json.load(fin)
+        statuses = {}
+        for result in summary["packages"].values():
+            statuses[result["status"]] = statuses.get(result["status"], 0) + 1
+        print("exit code {0} in {1:.1f}s, packages: {2}".format(
+            returncode, duration, ", ".join("{0} {1}".format(count, status) for status, count in sorted(statuses.items()))))
+        if args.output:
+            with open(args.output, 'w') as fout:
+                json.dump({"exit_code": returncode, "duration": duration, "args": installer_args, "python": python,
+                           "summary": summary}, fout, indent=2, sort_keys=True)
+        return returncode
+    finally:
+        if args.keep:
+            print("Work directory kept: {0}".format(work_dir))
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
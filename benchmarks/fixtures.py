@@ -0,0 +1,168 @@
+#coding=utf-8
+# Offline stand-ins for the installer's inputs: a local HTTP server with Range support, synthetic payloads and
+# archives, a synthetic site-packages and tiny dummy wheels.
+import base64
+import contextlib
+import functools
+import hashlib
+import http.server
+import io
+import os
+import re
+import tarfile
+import threading
+import zipfile
+
+
+class RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    # SimpleHTTPRequestHandler plus single byte ranges, which resumed and segmented downloads rely on, and
+    # HTTP/1.1 keep-alive like the real download hosts.
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def end_headers(self):
+        self.send_header("Accept-Ranges", "bytes")
+        super().end_headers()
+
+    def send_head(self):
+        path = self.translate_path(self.path)
+        match = re.match(r"bytes=(\d+)-(\d*)$", self.headers.get("Range", ""))
+        if not match or not os.path.isfile(path):
+            return super().send_head()
+        size = os.path.getsize(path)
+        start = int(match.group(1))
+        end = min(int(match.group(2)), size - 1) if match.group(2) else size - 1
+        if start >= size:
+            self.send_error(416)
+            return None
+        with open(path, 'rb') as fin:
+            fin.seek(start)
+            body = fin.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(path))
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Content-Range", "bytes {0}-{1}/{2}".format(start, end, size))
+        self.end_headers()
+        return io.BytesIO(body)
+
+
+@contextlib.contextmanager
+def serve_directory(directory, handler=RangeRequestHandler):
+    # Yields the base URL of a threaded HTTP server serving directory on a free localhost port.
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=directory))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield "http://127.0.0.1:{0}".format(server.server_port)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def make_payload(path, size, chunk_size=1024 * 1024):
+    with open(path, 'wb') as fout:
+        for offset in range(0, size, chunk_size):
+            fout.write(os.urandom(min(chunk_size, size - offset)))
+    return path
+
+
+def _member_data(i, size):
+    # Half random (incompressible) and half repetitive payloads, like the binaries and data of the CNTK drop.
+    return os.urandom(size) if i % 2 else (b"cntk" * (size // 4))
+
+
+def make_zip(path, members, size):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        for i in range(members):
+            zip_file.writestr("cntk/dir{0}/lib{1}.dll".format(i % 50, i), _member_data(i, size))
+    return path
+
+
+def make_tar(path, members, size):
+    with tarfile.open(path, 'w:gz') as tar_file:
+        for i in range(members):
+            data = _member_data(i, size)
+            info = tarfile.TarInfo("cntk/dir{0}/lib{1}.so".format(i % 50, i))
+            info.size = len(data)
+            tar_file.addfile(info, io.BytesIO(data))
+    return path
+
+
+def make_site_packages(path, dists):
+    for i in range(dists):
+        name = "fakepkg{0}".format(i)
+        os.makedirs(os.path.join(path, name))
+        open(os.path.join(path, name, "__init__.py"), 'w').close()
+        dist_info = os.path.join(path, "{0}-1.{1}.dist-info".format(name, i))
+        os.makedirs(dist_info)
+        with open(os.path.join(dist_info, "METADATA"), 'w') as fout:
+            fout.write("Metadata-Version: 2.1\nName: {0}\nVersion: 1.{1}\n".format(name, i))
+    return path
+
+
+def make_cntk_archive(path, target_version, members, size):
+    # A CNTK(BrainScript) BinaryDrop stand-in, .zip or .tar.gz by path, whose cntk/version.txt is target_version,
+    # e.g. CNTK-2-5-1.
+    files = [("cntk/version.txt", "{0}\n".format(target_version).encode())]
+    files.extend(("cntk/dependencies/lib/lib{0}.so".format(i), _member_data(i, size)) for i in range(members))
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for member, data in files:
+                zip_file.writestr(member, data)
+    else:
+        with tarfile.open(path, 'w:gz') as tar_file:
+            for member, data in files:
+                info = tarfile.TarInfo(member)
+                info.size = len(data)
+                tar_file.addfile(info, io.BytesIO(data))
+    return path
+
+
+def make_cntk_upgrade(path, base_path, target_version, changed_every):
+    # The next version of the archive at base_path: another cntk/version.txt and every changed_every-th member
+    # rewritten, the rest identical, like the dependency libs shared by two CNTK releases.
+    if base_path.endswith(".zip"):
+        with zipfile.ZipFile(base_path) as zip_file:
+            files = [(name, zip_file.read(name)) for name in zip_file.namelist()]
+    else:
+        with tarfile.open(base_path) as tar_file:
+            files = [(info.name, tar_file.extractfile(info).read()) for info in tar_file.getmembers() if info.isfile()]
+    files = [(member, "{0}\n".format(target_version).encode() if member == "cntk/version.txt"
+              else os.urandom(len(data)) if i % changed_every == 0 else data) for i, (member, data) in enumerate(files)]
+    if path.endswith(".zip"):
+        with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+            for member, data in files:
+                zip_file.writestr(member, data)
+    else:
+        with tarfile.open(path, 'w:gz') as tar_file:
+            for member, data in files:
+                info = tarfile.TarInfo(member)
+                info.size = len(data)
+                tar_file.addfile(info, io.BytesIO(data))
+    return path
+
+
+def make_wheel(directory, name, version, tag="py3-none-any", payload=b"", file_name=None, requires=()):
+    # A minimal valid wheel with one empty module, installable by pip without network or build. file_name
+    # overrides the standard wheel file name, e.g. to stand in for a wheel URL. requires are its Requires-Dist.
+    project = re.sub(r"[-_.]+", "_", name)
+    file_path = os.path.join(directory, file_name or "{0}-{1}-{2}.whl".format(project, version, tag))
+    dist_info = "{0}-{1}.dist-info".format(project, version)
+    files = [
+        ("{0}/__init__.py".format(project.lower()), payload),
+        ("{0}/METADATA".format(dist_info), ("Metadata-Version: 2.1\nName: {0}\nVersion: {1}\n".format(name, version)
+                                               + "".join("Requires-Dist: {0}\n".format(r) for r in requires)).encode()),
+        ("{0}/WHEEL".format(dist_info),
+         "Wheel-Version: 1.0\nGenerator: toolsforai-benchmarks\nRoot-Is-Purelib: true\nTag: {0}\n".format(tag).encode()),
+    ]
+    record = []
+    with zipfile.ZipFile(file_path, 'w') as wheel:
+        for member, data in files:
+            wheel.writestr(member, data)
+            digest = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b"=").decode()
+            record.append("{0},sha256={1},{2}".format(member, digest, len(data)))
+        record.append("{0}/RECORD,,".format(dist_info))
+        wheel.writestr("{0}/RECORD".format(dist_info), "\n".join(record) + "\n")
+    return file_path
@@ -0,0 +1,273 @@
+#coding=utf-8
+# Offline benchmark suite of the installer's hot paths, see fixtures.py for the local stand-ins.
+# Usage: python benchmarks/run_benchmarks.py [--quick] [--only download,unzip] [--output results.json]
+#                                            [--compare baseline.json] [--threshold 1.2]
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from init import logger
+import fixtures
+import install_pkg
+import pkg_config
+import staged_tree
+import utils
+
+MB = 1024 * 1024
+
+# (full, quick) parameters of every benchmark.
+SIZES = {
+    "download_mb": (256, 32),
+    "archive_members": (4000, 500),
+    "archive_member_size": (64 * 1024, 16 * 1024),
+    "site_dists": (5000, 1000),
+    "wheels": (24, 8),
+}
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    res = func(*args, **kwargs)
+    return time.perf_counter() - start, res
+
+
+def repeat(func, runs, setup=None):
+    # Returns the timings of runs calls of func, setup (not timed) runs before each of them.
+    times = []
+    for _ in range(runs):
+        if setup:
+            setup()
+        seconds, res = timed(func)
+        if res is False:
+            raise RuntimeError("benchmarked call failed")
+        times.append(seconds)
+    return times
+
+
+def bench_download(work_dir, size, runs):
+    serve_dir = os.path.join(work_dir, "serve")
+    os.makedirs(serve_dir)
+    fixtures.make_payload(os.path.join(serve_dir, "payload.bin"), size["download_mb"] * MB)
+    out = os.path.join(work_dir, "payload.bin")
+
+    def clean():
+        for path in (out, out + ".part"):
+            if os.path.exists(path):
+                os.remove(path)
+    results = {}
+    segment_min_size = utils.DOWNLOAD_SEGMENT_MIN_SIZE
+    utils.DOWNLOAD_SEGMENT_MIN_SIZE = 1
+    try:
+        with fixtures.serve_directory(serve_dir) as base_url:
+            url = base_url + "/payload.bin"
+            for segments in (1, 4):
+                results["download_segments{0}".format(segments)] = {
+                    "times": repeat(lambda: utils._download_file(url, out, segments=segments), runs, clean),
+                    "bytes": size["download_mb"] * MB}
+    finally:
+        utils.DOWNLOAD_SEGMENT_MIN_SIZE = segment_min_size
+        clean()
+    return results
+
+
+def bench_archives(work_dir, size, runs):
+    members, member_size = size["archive_members"], size["archive_member_size"]
+    zip_path = fixtures.make_zip(os.path.join(work_dir, "payload.zip"), members, member_size)
+    tar_path = fixtures.make_tar(os.path.join(work_dir, "payload.tar.gz"), members, member_size)
+    target = os.path.join(work_dir, "extracted")
+    clean = lambda: shutil.rmtree(target, ignore_errors=True)
+    params = {"members": members, "bytes": members * member_size}
+    results = {
+        "unzip": dict(params, times=repeat(lambda: utils._unzip_file(zip_path, target), runs, clean)),
+        "extract_tar": dict(params, times=repeat(lambda: utils._extract_tar(tar_path, target), runs, clean)),
+    }
+    serve_dir = os.path.dirname(tar_path)
+    with fixtures.serve_directory(serve_dir) as base_url:
+        url = base_url + "/" + os.path.basename(tar_path)
+        results["download_extract_tar"] = dict(params, times=repeat(lambda: utils._download_extract(url, target), runs, clean))
+    clean()
+    return results
+
+
+def bench_cntk_update(work_dir, size, runs):
+    # Installing a CNTK archive into an empty directory, and upgrading to a version that changes a tenth of it.
+    members, member_size = size["archive_members"], size["archive_member_size"]
+    old = fixtures.make_cntk_archive(os.path.join(work_dir, "old.tar.gz"), "CNTK-2-3-1", members, member_size)
+    new = fixtures.make_cntk_upgrade(os.path.join(work_dir, "new.tar.gz"), old, "CNTK-2-5-1", 10)
+    target = os.path.join(work_dir, "sdk")
+    clean = lambda: shutil.rmtree(target, ignore_errors=True)
+    install = lambda path: staged_tree.update_from_archive(staged_tree.StagedTree(target, "cntk"), path)
+
+    def install_old():
+        clean()
+        install(old)
+    params = {"members": members, "bytes": members * member_size}
+    results = {
+        "cntk_install": dict(params, times=repeat(lambda: install(new), runs, clean)),
+        "cntk_update": dict(params, times=repeat(lambda: install(new), runs, install_old)),
+    }
+    clean()
+    return results
+
+
+def bench_module_exists(work_dir, size, runs):
+    site_dir = fixtures.make_site_packages(os.path.join(work_dir, "site"), size["site_dists"])
+    sys.path.insert(0, site_dir)
+    try:
+        names = ["fakepkg{0}".format(size["site_dists"] - 1), "jupyter", "matplotlib", "pandas", "onnxmltools", "winmltools"]
+        index = utils.InstalledIndex()
+        return {
+            "module_exists": {"dists": size["site_dists"], "lookups": len(names),
+                              "times": repeat(lambda: [utils.module_exists(name) for name in names], runs)},
+            "installed_index_build": {"dists": size["site_dists"],
+                                      "times": repeat(lambda: index.version(names[0]), runs, index.__init__)},
+            "installed_index_lookup": {"dists": size["site_dists"], "lookups": len(names),
+                                       "times": repeat(lambda: [index.version(name) for name in names], runs)},
+        }
+    finally:
+        sys.path.remove(site_dir)
+
+
+def bench_rd_config(work_dir, size, runs):
+    config_path = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "config", "config.yaml")
+    return {
+        "rd_config_parse": {"times": repeat(lambda: pkg_config.load_config(config_path, use_cache=False), runs)},
+        "rd_config_cached": {"times": repeat(utils.rd_config, runs, utils.rd_config)},
+    }
+
+
+def _wheelhouse_config(wheelhouse, wheels):
+    # A config.yaml stand-in of dummy wheels: one base group, the others depending on it like scipy.
+    groups = {"base": dict(("bench-base{0}".format(i), {"name": "bench-base{0}".format(i), "version": "1.0"})
+                           for i in range(2))}
+    for i in range(wheels - 2):
+        group = groups.setdefault("group{0}".format(i % 4), {"depends": ["base"]})
+        group["bench-pkg{0}".format(i)] = {"name": "bench-pkg{0}".format(i), "version": "1.0"}
+    for group in groups.values():
+        for key, package in group.items():
+            if key != "depends":
+                fixtures.make_wheel(wheelhouse, package["name"], package["version"])
+    return pkg_config.Config.from_dict(groups, "benchmark")
+
+
+def bench_pip_install(work_dir, size, runs):
+    wheelhouse = os.path.join(work_dir, "wheelhouse")
+    os.makedirs(wheelhouse)
+    config = _wheelhouse_config(wheelhouse, size["wheels"])
+    target = os.path.join(work_dir, "target")
+    options = "--no-index --find-links {0} --target {1} --upgrade --disable-pip-version-check".format(wheelhouse, target)
+    clean = lambda: shutil.rmtree(target, ignore_errors=True)
+    results = {}
+    for name, jobs, batch in (("pip_install_serial", 1, False), ("pip_install_jobs4", 4, False), ("pip_install_batch", 1, True)):
+        results[name] = {"wheels": size["wheels"],
+                         "times": repeat(lambda: install_pkg.pip_software_install(config, options, False, False, jobs, batch),
+                                         runs, clean)}
+    if install_pkg.SysInfo.fail_install:
+        raise RuntimeError("pip install failed: {0}".format(install_pkg.SysInfo.fail_install))
+    clean()
+    return results
+
+
+BENCHMARKS = [
+    ("download", bench_download, 3),
+    ("archives", bench_archives, 3),
+    ("cntk_update", bench_cntk_update, 3),
+    ("module_exists", bench_module_exists, 5),
+    ("rd_config", bench_rd_config, 20),
+    ("pip_install", bench_pip_install, 1),
+]
+
+
+def summarize(results):
+    for result in results.values():
+        times = result["times"]
+        result["median"] = statistics.median(times)
+        result["min"] = min(times)
+        if result.get("bytes"):
+            result["throughput_mb"] = result["bytes"] / MB / result["median"]
+    return results
+
+
+def compare(results, baseline, threshold):
+    # Prints median ratios against the baseline, returns the names slower than threshold times the baseline.
+    regressions = []
+    print("{0:<28} {1:>12} {2:>12} {3:>8}".format("benchmark", "baseline", "current", "ratio"))
+    for name in sorted(results):
+        if name not in baseline:
+            print("{0:<28} {1:>12} {2:>11.4f}s {3:>8}".format(name, "-", results[name]["median"], "new"))
+            continue
+        ratio = results[name]["median"] / baseline[name]["median"]
+        mark = ""
+        if ratio > threshold:
+            regressions.append(name)
+            mark = " slower"
+        elif ratio < 1 / threshold:
+            mark = " faster"
+        print("{0:<28} {1:>11.4f}s {2:>11.4f}s {3:>7.2f}x{4}".format(name, baseline[name]["median"], results[name]["median"],
+                                                                  ratio, mark))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quick", action="store_true", help="smaller payloads, for a fast check.")
+    parser.add_argument("--only", help="comma separated benchmarks: {0}".format(", ".join(name for name, _, _ in BENCHMARKS)))
+    parser.add_argument("--runs", type=int, help="runs per measurement, default depends on the benchmark.")
+    parser.add_argument("--output", help="write the results as JSON to this file.")
+    parser.add_argument("--compare", help="JSON results of a previous run to compare the medians against.")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="with --compare, exit with 1 when a median is this many times slower than the baseline.")
+    parser.add_argument("-v", "--verbose", action="store_true")
+    args = parser.parse_args()
+    if not args.verbose:
+        logger.setLevel(logging.WARNING)
+
+    size = dict((key, value[1] if args.quick else value[0]) for key, value in SIZES.items())
+    selected = args.only.split(",") if args.only else [name for name, _, _ in BENCHMARKS]
+    results = {}
+    for name, func, runs in BENCHMARKS:
+        if name not in selected:
+            continue
+        work_dir = tempfile.mkdtemp(prefix="bench-{0}-".format(name))
+        try:
+            print("Running {0} ...".format(name))
+            results.update(func(work_dir, size, args.runs or runs))
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    summarize(results)
+
+    report = {
+        "meta": {"created": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": sys.version.split()[0],
+                 "platform": platform.platform(terse=True), "cpus": os.cpu_count(), "quick": args.quick},
+        "results": results,
+    }
+    for name in sorted(results):
+        result = results[name]
+        extra = " ({0:.1f} MB/s)".format(result["throughput_mb"]) if "throughput_mb" in result else ""
+        print("{0:<28} median {1:.4f}s  min {2:.4f}s{3}".format(name, result["median"], result["min"], extra))
+    if args.output:
+        with open(args.output, 'w') as fout:
+            json.dump(report, fout, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as fin:
+            baseline = json.load(fin)
+        if baseline["meta"].get("quick") != args.quick:
+            print("Warning: baseline quick={0} differs from this run.".format(baseline["meta"].get("quick")))
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print("Slower than {0}x the baseline: {1}".format(args.threshold, ", ".join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,205 @@
+#coding=utf-8
+from init import TOOLSFORAI_OS_LINUX, TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_MACOS
+from init import SysInfo
+from init import logger
+import cache
+import install_pkg
+import tracing
+import utils
+
+import atexit
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BUNDLE_MANIFEST_NAME = "manifest.json"
+BUNDLE_WHEELS_DIR = "wheels"
+BUNDLE_CNTK_DIR = "cntk"
+
+_PLATFORM_TAGS = {
+    TOOLSFORAI_OS_LINUX: ["manylinux1_x86_64", "linux_x86_64"],
+    TOOLSFORAI_OS_WIN: ["win_amd64"],
+    TOOLSFORAI_OS_MACOS: ["macosx_10_9_x86_64"],
+}
+
+_ARCHIVE_FORMATS = [(".tar.gz", "gztar"), (".tgz", "gztar"), (".tar", "tar"), (".zip", "zip")]
+
+
+def _archive_format(path):
+    return next((fmt for ext, fmt in _ARCHIVE_FORMATS if path.lower().endswith(ext)), None)
+
+
+def apply_target(os_name=None, python=None, gpu=None, cuda=None):
+    # Point SysInfo at the bundle target, unspecified fields keep the detected values of this machine.
+    if os_name:
+        SysInfo.os = os_name
+    if python:
+        SysInfo.python = python.replace('.', '')
+    if gpu is not None:
+        SysInfo.gpu = gpu
+    if cuda:
+        SysInfo.cuda = cuda
+    elif SysInfo.gpu and not SysInfo.cuda:
+        SysInfo.cuda = "9.0"
+    if not SysInfo.gpu:
+        SysInfo.cuda = None
+    return {"os": SysInfo.os, "python": SysInfo.python, "gpu": SysInfo.gpu, "cuda": SysInfo.cuda}
+
+
+def _offline_requirement(name, version, pkg):
+    # Returns (requirement, wheel file name) resolvable from the bundle wheels directory alone.
+    if pkg.endswith(".whl"):
+        return name, pkg.rstrip('/').rsplit('/', 1)[-1].rsplit(os.path.sep, 1)[-1]
+    if "git+" in pkg:
+        return name, None
+    return install_pkg._pip_requirement(name, version)[0].replace(" ", ""), None
+
+
+def _download_wheels(requirements, wheels_dir, target, is_host):
+    requirements_path = os.path.join(wheels_dir, "requirements.txt")
+    with open(requirements_path, 'w') as fout:
+        for name, _, pkg in requirements:
+            fout.write("{0}\n".format(install_pkg._pip_batch_line(name, pkg)))
+    if is_host:
+        # Build wheels for sdists and git requirements too, so that installing never needs a compiler or network.
+        cmd = [sys.executable, '-m', 'pip', 'wheel', '-w', wheels_dir, '-r', requirements_path]
+    else:
+        python = target["python"]
+        abi = "cp{0}m".format(python) if int(python) < 38 else "cp{0}".format(python)
+        cmd = [sys.executable, '-m', 'pip', 'download', '-d', wheels_dir, '--only-binary=:all:',
+               '--python-version', python, '--implementation', 'cp', '--abi', abi, '--abi', 'none', '--abi', 'abi3']
+        for tag in _PLATFORM_TAGS[target["os"]]:
+            cmd.extend(['--platform', tag])
+        cmd.extend(['-r', requirements_path])
+    logger.debug("Bundle pip command: {0}".format(" ".join(cmd)))
+    with tracing.span("bundle", "pip", requirements=len(requirements)):
+        res = subprocess.call(cmd)
+    os.remove(requirements_path)
+    return res == 0
+
+
+def _fetch_cntk_archive(cntk_dir, digests):
+    ver, cntk_file_name, cntk_url = install_pkg.cntk_archive()
+    cntk_file_path = os.path.join(cntk_dir, cntk_file_name)
+    sha256 = (digests[cntk_file_name],) if cntk_file_name in digests else ()
+    cached_file = cache.fetch(cntk_url, sha256)
+    if cached_file:
+        shutil.copyfile(cached_file, cntk_file_path)
+    elif not utils._download_file(cntk_url, cntk_file_path, segments=4, sha256=sha256):
+        return None
+    return {"version": ver, "url": cntk_url, "file": "/".join([BUNDLE_CNTK_DIR, cntk_file_name]),
+            "sha256": cache._file_sha256(cntk_file_path)}
+
+
+def build_bundle(pkg_info, output, os_name=None, python=None, gpu=None, cuda=None, groups=None):
+    # Download every wheel of the install plan and the CNTK(BrainScript) archive of a target into a directory,
+    # or into a single archive when output ends with .zip, .tar or .tar.gz.
+    host = (SysInfo.os, SysInfo.python)
+    target = apply_target(os_name, python, gpu, cuda)
+    logger.info("Begin to build bundle for {0} ...".format(target))
+    if target["os"] not in _PLATFORM_TAGS:
+        logger.error("Bundle can not be built for OS {0}.".format(target["os"]))
+        return False
+    archive_format = _archive_format(output)
+    bundle_dir = tempfile.mkdtemp(prefix="toolsforai-bundle-") if archive_format else output
+    try:
+        wheels_dir = os.path.join(bundle_dir, BUNDLE_WHEELS_DIR)
+        cntk_dir = os.path.join(bundle_dir, BUNDLE_CNTK_DIR)
+        for directory in (wheels_dir, cntk_dir):
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+
+        requirements = install_pkg.pip_collect_requirements(pkg_info, [], ignore_installed=True, groups=groups)
+        is_host = host == (target["os"], target["python"])
+        skipped = []
+        if not is_host:
+            # pip download --only-binary can not build git requirements, e.g. tf2onnx, for another target.
+            skipped = [requirement for requirement in requirements if "git+" in requirement[2]]
+            requirements = [requirement for requirement in requirements if requirement not in skipped]
+            for name, version, pkg in skipped:
+                logger.warning("Skip {0} {1} in bundle for {2}: {3} can only be built on the target.".format(
+                    name, version, target, pkg))
+        if not _download_wheels(requirements, wheels_dir, target, is_host):
+            logger.error("Fail to download wheels into bundle {0}.".format(output))
+            return False
+        cntk = None
+        if target["os"] in (TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_LINUX) and (groups is None or "cntk" in groups):
+            cntk = _fetch_cntk_archive(cntk_dir, pkg_info.digests)
+            if not cntk:
+                logger.error("Fail to download CNTK(BrainScript) archive into bundle {0}.".format(output))
+                return False
+
+        manifest = {
+            "target": target,
+            "groups": groups,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "requirements": [dict(zip(("name", "version", "requirement", "wheel"),
+                                      (name, version) + _offline_requirement(name, version, pkg)))
+                             for name, version, pkg in requirements],
+            "skipped": [{"name": name, "version": version, "requirement": pkg,
+                         "reason": "git requirements are only built into bundles for the building machine"} for name, version, pkg in skipped],
+            "wheels": sorted(os.listdir(wheels_dir)),
+            "cntk": cntk,
+        }
+        with open(os.path.join(bundle_dir, BUNDLE_MANIFEST_NAME), 'w') as fout:
+            json.dump(manifest, fout, indent=2)
+
+        if archive_format:
+            base_name = output[:-len(next(ext for ext, fmt in _ARCHIVE_FORMATS if output.lower().endswith(ext)))]
+            created = shutil.make_archive(base_name, archive_format, bundle_dir)
+            if created != output:
+                os.replace(created, output)
+        logger.info("Build bundle {0} successfully!".format(output))
+        return True
+    finally:
+        if archive_format:
+            shutil.rmtree(bundle_dir, ignore_errors=True)
+
+
+def open_bundle(path):
+    # Returns (bundle directory, manifest), unpacking archived bundles into a temporary directory.
+    if os.path.isfile(path):
+        bundle_dir = tempfile.mkdtemp(prefix="toolsforai-bundle-")
+        atexit.register(shutil.rmtree, bundle_dir, True)
+        logger.info("Unpacking bundle {0} ...".format(path))
+        shutil.unpack_archive(path, bundle_dir)
+    else:
+        bundle_dir = path
+    with open(os.path.join(bundle_dir, BUNDLE_MANIFEST_NAME)) as fin:
+        manifest = json.load(fin)
+    target = manifest["target"]
+    current = {"os": SysInfo.os, "python": SysInfo.python, "gpu": SysInfo.gpu, "cuda": SysInfo.cuda}
+    if any(target[key] != current[key] for key in ("os", "python", "gpu")) or (target["gpu"] and target["cuda"] != current["cuda"]):
+        logger.warning("Bundle {0} is built for {1}, but this machine is {2}.".format(path, target, current))
+    return bundle_dir, manifest
+
+
+def bundle_cntk_archive(bundle_dir, manifest):
+    # Returns the verified CNTK(BrainScript) archive of the bundle, or None.
+    cntk = manifest.get("cntk")
+    if not cntk:
+        return None
+    cntk_file_path = os.path.join(bundle_dir, *cntk["file"].split("/"))
+    if not os.path.isfile(cntk_file_path) or cache._file_sha256(cntk_file_path) != cntk["sha256"]:
+        logger.error("CNTK(BrainScript) archive in bundle is missing or corrupted: {0}".format(cntk_file_path))
+        return None
+    return cntk_file_path
+
+
+def pip_bundle_install(bundle_dir, manifest, options, user, verbose):
+    pip_ops = install_pkg._pip_options(options, user, verbose)
+    wheels_dir = os.path.join(bundle_dir, BUNDLE_WHEELS_DIR)
+    pip_ops.extend(["--no-index", "--find-links", wheels_dir])
+    requirements = [(item["name"], item["version"],
+                     os.path.join(wheels_dir, item["wheel"]) if item.get("wheel") else item["requirement"])
+                    for item in manifest["requirements"]]
+    for item in manifest.get("skipped", []):
+        logger.warning("Bundle has no {0} {1}, {2}. Install it with network access.".format(
+            item["name"], item["version"], item["reason"]))
+    with install_pkg.pip_lock():
+        utils.installed_index.invalidate()
+        return install_pkg.pip_batch_install(requirements, pip_ops)
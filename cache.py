@@ -0,0 +1,222 @@
+#coding=utf-8
+from init import logger
+import locks
+import utils
+
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+CACHE_MAX_SIZE = 10 * 1024 * 1024 * 1024
+CACHE_INDEX_NAME = "index.json"
+
+
+def default_cache_dir():
+    return os.path.sep.join([os.path.expanduser('~'), '.toolsforai', 'cache'])
+
+
+def _file_sha256(file_path, chunk_size=utils.DOWNLOAD_CHUNK_SIZE):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as fin:
+        for chunk in iter(lambda: fin.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+class ArtifactCache(object):
+    # Downloaded artifacts are stored once per content under blobs/<sha256>/<file name>, so that wheels keep the
+    # file name pip needs. index.json maps each URL to its blob, size and last use time for LRU eviction.
+    def __init__(self, cache_dir, max_size=CACHE_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.index_path = os.path.join(cache_dir, CACHE_INDEX_NAME)
+        self.lock = threading.Lock()
+        self.url_locks = {}
+
+    def _load_index(self):
+        try:
+            with open(self.index_path) as fin:
+                return json.load(fin)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _save_index(self, index):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as fout:
+            json.dump(index, fout, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.index_path)
+
+    @contextlib.contextmanager
+    def _index_lock(self):
+        # The index is shared with overlapping installer runs and the processes of --targets.
+        with self.lock, locks.FileLock(os.path.join(self.cache_dir, "index.lock")):
+            yield
+
+    def _url_lock(self, url):
+        with self.lock:
+            return self.url_locks.setdefault(url, threading.Lock())
+
+    def _remove_blob(self, index, entry):
+        if any(other["file"] == entry["file"] for other in index.values()):
+            return
+        shutil.rmtree(os.path.dirname(os.path.join(self.cache_dir, entry["file"])), ignore_errors=True)
+
+    def lookup(self, url, sha256=()):
+        # Returns the cached file of url, or None on miss or when the cached content fails verification. With the
+        # expected sha256 digests, a cached file of another content is stale and downloaded again.
+        with self._index_lock():
+            entry = self._load_index().get(url)
+        if not entry:
+            return None
+        file_path = os.path.join(self.cache_dir, entry["file"])
+        stale = sha256 and entry["sha256"] not in sha256
+        if stale or not os.path.isfile(file_path) or os.path.getsize(file_path) != entry["size"] \
+                or _file_sha256(file_path) != entry["sha256"]:
+            if stale:
+                logger.warning("Cached file of {0} does not match the expected sha256, it will be downloaded again.".format(url))
+            else:
+                logger.warning("Cached file of {0} is corrupted, it will be downloaded again.".format(url))
+            with self._index_lock():
+                index = self._load_index()
+                entry = index.pop(url, None)
+                if entry:
+                    self._remove_blob(index, entry)
+                self._save_index(index)
+            return None
+        with self._index_lock():
+            index = self._load_index()
+            if url in index:
+                index[url]["last_used"] = time.time()
+                self._save_index(index)
+        logger.info("Use cached {0}.".format(url))
+        return file_path
+
+    def add(self, url, file_path, sha256=None):
+        # Moves a downloaded file into the cache and returns its cached path. sha256 is the digest of the file
+        # when it is already known.
+        sha256 = sha256 or _file_sha256(file_path)
+        file_name = url.rstrip('/').rsplit('/', 1)[-1]
+        relative_path = "/".join(["blobs", sha256, file_name])
+        cached_path = os.path.join(self.cache_dir, "blobs", sha256, file_name)
+        if not os.path.isdir(os.path.dirname(cached_path)):
+            os.makedirs(os.path.dirname(cached_path))
+        os.replace(file_path, cached_path)
+        with self._index_lock():
+            index = self._load_index()
+            index[url] = {"sha256": sha256, "size": os.path.getsize(cached_path),
+                          "file": relative_path, "last_used": time.time()}
+            self._evict(index, keep=url)
+            self._save_index(index)
+        return cached_path
+
+    def _evict(self, index, keep=None):
+        blobs = {}
+        for entry in index.values():
+            blobs[entry["file"]] = entry["size"]
+        total = sum(blobs.values())
+        for url, entry in sorted(index.items(), key=lambda item: item[1]["last_used"]):
+            if total <= self.max_size:
+                break
+            if url == keep:
+                continue
+            del index[url]
+            if entry["file"] in blobs and not any(other["file"] == entry["file"] for other in index.values()):
+                total -= blobs.pop(entry["file"])
+                logger.debug("Evict cached {0}.".format(url))
+                self._remove_blob(index, entry)
+
+    @contextlib.contextmanager
+    def _download_lock(self, url):
+        # Yields the temporary path of a download of url. A run that finds url being downloaded by another run
+        # waits for it and uses its download.
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        with self._url_lock(url), locks.FileLock(os.path.join(self.cache_dir, "locks", key + ".lock"), url):
+            tmp_dir = os.path.join(self.cache_dir, "tmp")
+            if not os.path.isdir(tmp_dir):
+                os.makedirs(tmp_dir)
+            yield os.path.join(tmp_dir, key)
+
+    def fetch(self, url, sha256=()):
+        # Returns a local path of url, downloading it into the cache on miss, or None on failure. sha256 are the
+        # expected digests, the download is verified while it streams.
+        with self._download_lock(url) as tmp_path:
+            file_path = self.lookup(url, sha256)
+            if file_path:
+                return file_path
+            if not utils._download_file(url, tmp_path, sha256=sha256):
+                return None
+            return self.add(url, tmp_path, sha256[0] if len(sha256) == 1 else None)
+
+    def download_extract(self, url, target_dir, sha256=(), extract=utils._extract_all):
+        # utils._download_extract that also fills the cache with the archive as it streams. On a hit, which
+        # another run may have added meanwhile, the cached archive is extracted instead.
+        with self._download_lock(url) as tmp_path:
+            file_path = self.lookup(url, sha256)
+            if file_path:
+                return _extract_file(file_path, target_dir, extract)
+            if not utils._download_extract(url, target_dir, sha256=sha256, extract=extract, copy_path=tmp_path):
+                return False
+            self.add(url, tmp_path, sha256[0] if len(sha256) == 1 else None)
+            return True
+
+
+def _extract_file(file_path, target_dir, extract):
+    # Calls extract(archive, target_dir) like utils._download_extract, with an archive on disk.
+    try:
+        if file_path.lower().endswith(".zip"):
+            import zipfile
+            with zipfile.ZipFile(file_path) as archive:
+                extract(archive, target_dir)
+        else:
+            import tarfile
+            with tarfile.open(file_path) as archive:
+                extract(archive, target_dir)
+        return True
+    except Exception as e:
+        logger.error("Fail to extract {0}. Error: {1}".format(file_path, e))
+        return False
+
+
+artifact_cache = None
+
+
+def configure(cache_dir=None, enabled=True, max_size=CACHE_MAX_SIZE):
+    global artifact_cache
+    if not enabled:
+        artifact_cache = None
+        return None
+    cache_dir = cache_dir or default_cache_dir()
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        artifact_cache = ArtifactCache(cache_dir, max_size)
+        logger.debug("Artifact cache directory: {0}".format(cache_dir))
+    except Exception as e:
+        logger.warning("Fail to create cache directory {0}, downloading without cache. Error: {1}".format(cache_dir, e))
+        artifact_cache = None
+    return artifact_cache
+
+
+def fetch(url, sha256=()):
+    # Returns a cached local path of url, or None when the cache is disabled or the download fails.
+    if artifact_cache is None:
+        return None
+    return artifact_cache.fetch(url, sha256)
+
+
+def lookup(url, sha256=()):
+    # Returns the cached file of url, or None on miss or when the cache is disabled.
+    if artifact_cache is None:
+        return None
+    return artifact_cache.lookup(url, sha256)
+
+
+def download_extract(url, target_dir, sha256=(), extract=utils._extract_all):
+    # Downloads and extracts an archive in one pass, keeping a copy in the cache when it is enabled.
+    if artifact_cache is None:
+        return utils._download_extract(url, target_dir, sha256=sha256, extract=extract)
+    return artifact_cache.download_extract(url, target_dir, sha256, extract)
@@ -0,0 +1,281 @@
+#coding=utf-8
+from init import logger
+import tracing
+
+import base64
+import threading
+import time
+
+# Concurrent requests per host, a host=N item of --max-host-connections overrides it for one host.
+HTTP_MAX_PER_HOST = 4
+HTTP_MAX_REDIRECTS = 5
+# Error and redirect bodies up to this size are read so that the connection can be reused.
+HTTP_DRAIN_LIMIT = 64 * 1024
+
+
+class HTTPError(IOError):
+    # code is the HTTP status, like urllib.error.HTTPError, so callers can tell client errors from the rest.
+    def __init__(self, url, code, reason):
+        IOError.__init__(self, "HTTP Error {0}: {1} ({2})".format(code, reason, url))
+        self.url = url
+        self.code = code
+        self.reason = reason
+
+
+class PooledResponse(object):
+    # File-like response body. Closing it returns the connection to the pool when the body was read to the end
+    # and the server keeps the connection alive, otherwise the connection is closed.
+    def __init__(self, pool, key, conn, response, url):
+        self.pool = pool
+        self.key = key
+        self.conn = conn
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.headers = response.headers
+        self.closed = False
+
+    def read(self, size=-1):
+        data = self.response.read() if size is None or size < 0 else self.response.read(size)
+        self.pool._count(self.key, "bytes", len(data))
+        return data
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if not self.response.isclosed() and self.response.length == 0:
+            # A HEAD or empty response is complete, reading its empty body marks it so.
+            self.response.read()
+        reusable = self.response.isclosed() and not self.response.will_close
+        if not reusable:
+            self.response.close()
+        self.pool._release(self.key, self.conn, reusable)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool(object):
+    # Keep-alive HTTP(S) connections by (scheme, host, port), shared by every download thread. At most
+    # max_per_host requests (host_limits overrides per host name) are open to one host at the same time,
+    # further requests wait for a connection to be released.
+    def __init__(self, max_per_host=HTTP_MAX_PER_HOST, host_limits=None):
+        self.max_per_host = max_per_host
+        self.host_limits = dict(host_limits or {})
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.slots = {}
+        self.proxies = {}
+        self.stats = {}
+        self.ssl_context = None
+
+    def _limit(self, host):
+        return self.host_limits.get(host, self.max_per_host)
+
+    def _slot(self, key):
+        with self.lock:
+            if key not in self.slots:
+                self.slots[key] = threading.BoundedSemaphore(max(1, self._limit(key[1])))
+                self.stats["{0}://{1}:{2}".format(*key)] = {"connections": 0, "requests": 0, "reused": 0, "redirects": 0,
+                                                            "bytes": 0, "first": None, "last": None}
+            return self.slots[key]
+
+    def _count(self, key, field, value=1):
+        with self.lock:
+            stats = self.stats["{0}://{1}:{2}".format(*key)]
+            stats[field] += value
+            now = time.perf_counter()
+            stats["first"] = stats["first"] or now
+            stats["last"] = now
+
+    def _context(self):
+        # Certificates and host names are verified against the system CA store (or SSL_CERT_FILE).
+        with self.lock:
+            if self.ssl_context is None:
+                import ssl
+                self.ssl_context = ssl.create_default_context()
+            return self.ssl_context
+
+    def _proxy(self, scheme, host):
+        # (host, port, Proxy-Authorization header or None) of the http_proxy/https_proxy for host, or None.
+        with self.lock:
+            if (scheme, host) in self.proxies:
+                return self.proxies[(scheme, host)]
+        import urllib.parse
+        import urllib.request
+        proxy = None
+        proxy_url = urllib.request.getproxies().get(scheme)
+        if proxy_url and not urllib.request.proxy_bypass(host):
+            parts = urllib.parse.urlsplit(proxy_url if "://" in proxy_url else "http://" + proxy_url)
+            auth = None
+            if parts.username:
+                credentials = "{0}:{1}".format(urllib.parse.unquote(parts.username), urllib.parse.unquote(parts.password or ""))
+                auth = "Basic " + base64.b64encode(credentials.encode("utf-8")).decode("ascii")
+            proxy = (parts.hostname, parts.port or 8080, auth)
+            logger.debug("Use proxy {0}:{1} for {2}://{3}.".format(proxy[0], proxy[1], scheme, host))
+        with self.lock:
+            self.proxies[(scheme, host)] = proxy
+        return proxy
+
+    def _connect(self, key, timeout):
+        import http.client
+        scheme, host, port = key
+        proxy = self._proxy(scheme, host)
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(proxy[0] if proxy else host, proxy[1] if proxy else port,
+                                               timeout=timeout, context=self._context())
+            if proxy:
+                conn.set_tunnel(host, port, {"Proxy-Authorization": proxy[2]} if proxy[2] else None)
+        else:
+            conn = http.client.HTTPConnection(proxy[0] if proxy else host, proxy[1] if proxy else port, timeout=timeout)
+        self._count(key, "connections")
+        return conn
+
+    def _acquire(self, key, timeout):
+        # Returns (connection, reused), an idle connection of key if any.
+        with self.lock:
+            idle = self.idle.get(key)
+            conn = idle.pop() if idle else None
+        if conn is None:
+            return self._connect(key, timeout), False
+        if conn.sock is not None:
+            conn.sock.settimeout(timeout)
+        return conn, True
+
+    def _release(self, key, conn, reusable):
+        if reusable:
+            with self.lock:
+                idle = self.idle.setdefault(key, [])
+                if len(idle) < self._limit(key[1]):
+                    idle.append(conn)
+                    conn = None
+        if conn is not None:
+            conn.close()
+        self.slots[key].release()
+
+    def _send(self, key, url, method, headers, timeout):
+        # One request on a pooled connection. A reused connection the server has closed in the meantime fails
+        # on the first use, the request is then sent once more on a new connection.
+        import http.client
+        import urllib.parse
+        parts = urllib.parse.urlsplit(url)
+        path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        proxy = self._proxy(key[0], key[1])
+        request_headers = dict(headers or {})
+        if key[0] == "http" and proxy:
+            # A plain HTTP proxy takes the absolute URL.
+            path = url
+            if proxy[2]:
+                request_headers["Proxy-Authorization"] = proxy[2]
+        slot = self._slot(key)
+        slot.acquire()
+        try:
+            while True:
+                conn, reused = self._acquire(key, timeout)
+                try:
+                    conn.request(method, path, headers=request_headers)
+                    response = conn.getresponse()
+                except (http.client.HTTPException, ConnectionError) as e:
+                    conn.close()
+                    if not reused:
+                        raise
+                    logger.debug("Keep-alive connection to {0} was closed ({1}), reconnect.".format(key[1], e))
+                    continue
+                except BaseException:
+                    conn.close()
+                    raise
+                self._count(key, "requests")
+                if reused:
+                    self._count(key, "reused")
+                return PooledResponse(self, key, conn, response, url)
+        except BaseException:
+            slot.release()
+            raise
+
+    def request(self, url, headers=None, method=None, timeout=60):
+        # Returns the PooledResponse of url following redirects, raises HTTPError for 4xx and 5xx statuses.
+        import urllib.parse
+        method = method or "GET"
+        for _ in range(HTTP_MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            if parts.scheme not in ("http", "https"):
+                raise ValueError("Unsupported URL scheme: {0}".format(url))
+            key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+            response = self._send(key, url, method, headers, timeout)
+            if response.status in (301, 302, 303, 307, 308) and response.headers.get("Location"):
+                location = urllib.parse.urljoin(url, response.headers["Location"])
+                self._drain(response)
+                self._count(key, "redirects")
+                logger.debug("Redirect {0} to {1}.".format(url, location))
+                if response.status == 303 and method != "HEAD":
+                    method = "GET"
+                url = location
+                continue
+            if response.status >= 400:
+                reason = response.response.reason
+                self._drain(response)
+                raise HTTPError(url, response.status, reason)
+            return response
+        raise HTTPError(url, 310, "Too many redirects")
+
+    def _drain(self, response):
+        length = response.headers.get("Content-Length")
+        if length is not None and length.isdigit() and int(length) <= HTTP_DRAIN_LIMIT:
+            response.read()
+        response.close()
+
+    def report(self):
+        # {"scheme://host:port": counters} for the trace report, throughput is bytes per second between the first
+        # request and the last read of the host.
+        with self.lock:
+            report = {}
+            for host, stats in self.stats.items():
+                stats = dict(stats)
+                first, last = stats.pop("first"), stats.pop("last")
+                stats["throughput"] = round(stats["bytes"] / (last - first)) if first and last and last > first else 0
+                report[host] = stats
+            return report
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+pool = ConnectionPool()
+tracing.register_stats("http", pool.report)
+
+
+def configure(max_per_host=None, host_limits=None):
+    # max_per_host and host_limits ({host: limit}) apply to hosts that are not connected yet.
+    if max_per_host:
+        pool.max_per_host = max_per_host
+    if host_limits:
+        pool.host_limits.update(host_limits)
+
+
+def parse_host_limits(value):
+    # "4,cntk.ai=8" -> (4, {"cntk.ai": 8})
+    max_per_host, host_limits = None, {}
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, limit = item.rpartition("=")
+        if not limit.isdigit() or int(limit) < 1:
+            raise ValueError("Invalid connection limit: {0}".format(item))
+        if host:
+            host_limits[host] = int(limit)
+        else:
+            max_per_host = int(limit)
+    return max_per_host, host_limits
+
+
+def request(url, headers=None, method=None, timeout=60):
+    return pool.request(url, headers, method, timeout)
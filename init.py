@@ -1,21 +1,24 @@
 #coding=utf-8
-import argparse
-import ctypes
 import logging
-import platform
 import sys
 
 TOOLSFORAI_OS_WIN = "win"
 TOOLSFORAI_OS_LINUX = "linux"
 TOOLSFORAI_OS_MACOS = "mac"
 
+# exit codes
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+EXIT_DETECT_FAIL = 2
+EXIT_PARTIAL_INSTALL = 3
+
 
 def _init_logger(log_level=logging.INFO):
     logger = logging.getLogger('Microsoft Visual Studio Tools for AI')
     logger.setLevel(log_level)
     logger.propagate = False
     handler = logging.StreamHandler(sys.stdout)
-    formatter = logging.Formatter(fmt='%(asctime)s [%(levelname)s] '
+    formatter = logging.Formatter(fmt='%(asctime)s.%(msecs)03d [%(levelname)s] '
                                       '[%(name)s] %(message)s',
                                   datefmt='%H:%M:%S')
     handler.setFormatter(formatter)
@@ -24,42 +27,91 @@ def _init_logger(log_level=logging.INFO):
 logger = _init_logger()
 
 def set_options():
+    import argparse
     parser = argparse.ArgumentParser()
+    parser.add_argument("command", nargs="?", default="install", choices=["install", "bundle"],
+                        help="install packages (default), or bundle them for offline installation.")
     parser.add_argument("-v", "--verbose", help="give more output to debug log level.", action="store_true")
     parser.add_argument("-u", "--user", help="install to the Python user install directory for your platform.",
                         action="store_true")
     parser.add_argument("--cuda80", help="forcing the installation of the dependency packages for cuda 8.0.",
                         action="store_true")
+    parser.add_argument("--refresh-detect", help="detect system information again instead of using the saved snapshot.",
+                        action="store_true")
     parser.add_argument("-o", "--options",
                         help="add extra options for packages installation. --user ignored if this option is supplied.")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of package groups installed concurrently, 1 keeps the serial install order.")
+    parser.add_argument("--base-url", help="root URL of a mirror: pip uses <base-url>/simple/ as package index and "
+                                           "https://host/path downloads come from <base-url>/host/path.")
+    parser.add_argument("--max-host-connections",
+                        help="concurrent downloads per host, default 4, with host=N items for single hosts, e.g. 4,cntk.ai=8.")
+    parser.add_argument("--cache-dir", help="directory of the downloaded artifact cache, default ~/.toolsforai/cache.")
+    parser.add_argument("--no-cache", help="always download artifacts instead of using the local cache.",
+                        action="store_true")
+    parser.add_argument("--plan", help="print which packages would be installed or changed, then exit.",
+                        action="store_true")
+    parser.add_argument("--cntk-timeout", type=float,
+                        help="seconds to wait for CNTK(BrainScript) installation after the pip packages, default no limit.")
+    parser.add_argument("--non-interactive", help="never prompt, for unattended runs. See exit codes in README.",
+                        action="store_true")
+    parser.add_argument("--summary", help="write a JSON summary of system information and per-package results to this file.")
+    parser.add_argument("--trace", help="write a JSON (Chrome trace format) report of timings and resource usage to this file.")
+    parser.add_argument("--only", help="comma separated groups or profiles of config/config.yaml to install, "
+                                       "e.g. tensorflow,pytorch or inference-tf. Default is every group.")
+    parser.add_argument("--exclude", help="comma separated groups or profiles of config/config.yaml not to install, "
+                                          "e.g. cntk,caffe2. Groups depending on them are excluded too.")
+    parser.add_argument("--targets", help="comma separated Python interpreters or venv directories to install into "
+                                          "concurrently instead of this Python, e.g. /opt/py36/bin/python,~/venvs/app.")
+    parser.add_argument("--batch", help="resolve and install all selected packages with a single pip invocation.",
+                        action="store_true")
+    parser.add_argument("--from-bundle", help="install offline from a bundle directory or archive built by 'bundle'.")
+    parser.add_argument("--output", default="toolsforai-bundle",
+                        help="bundle directory, or archive path ending with .zip, .tar or .tar.gz.")
+    parser.add_argument("--target-os", choices=[TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_LINUX, TOOLSFORAI_OS_MACOS],
+                        help="OS of the bundle target, default is this machine.")
+    parser.add_argument("--target-python", help="Python version of the bundle target, e.g. 3.6, default is this machine.")
+    parser.add_argument("--target-gpu", dest="target_gpu", action="store_const", const=True,
+                        help="bundle GPU packages, default follows this machine.")
+    parser.add_argument("--target-cpu", dest="target_gpu", action="store_const", const=False,
+                        help="bundle CPU-only packages, default follows this machine.")
+    parser.add_argument("--target-cuda", choices=["8.0", "9.0"], help="CUDA version of the bundle target.")
     args, unknown = parser.parse_known_args()
     return args, unknown
 
-# ShellExecuteInfo
-if platform.system() == "Windows":
-    from ctypes.wintypes import HANDLE, BOOL, DWORD, HWND, HINSTANCE, HKEY
-    class ShellExecuteInfo(ctypes.Structure):
-        _fields_ = [('cbSize', DWORD),
-                    ('fMask', ctypes.c_ulong),
-                    ('hwnd', HWND),
-                    ('lpVerb', ctypes.c_char_p),
-                    ('lpFile', ctypes.c_char_p),
-                    ('lpParameters', ctypes.c_char_p),
-                    ('lpDirectory', ctypes.c_char_p),
-                    ('nShow', ctypes.c_int),
-                    ('hInstApp', HINSTANCE),
-                    ('lpIDList', ctypes.c_void_p),
-                    ('lpClass', ctypes.c_char_p),
-                    ('hKeyClass', HKEY),
-                    ('dwHotKey', DWORD),
-                    ('hIcon', HANDLE),
-                    ('hProcess', HANDLE)]
+# ShellExecuteInfo, the ctypes structure is only built when a command is run as admin on Windows.
+_shell_execute_info_class = None
+
+def shell_execute_info(**kw):
+    global _shell_execute_info_class
+    if _shell_execute_info_class is None:
+        import ctypes
+        from ctypes.wintypes import HANDLE, BOOL, DWORD, HWND, HINSTANCE, HKEY
+        class ShellExecuteInfo(ctypes.Structure):
+            _fields_ = [('cbSize', DWORD),
+                        ('fMask', ctypes.c_ulong),
+                        ('hwnd', HWND),
+                        ('lpVerb', ctypes.c_char_p),
+                        ('lpFile', ctypes.c_char_p),
+                        ('lpParameters', ctypes.c_char_p),
+                        ('lpDirectory', ctypes.c_char_p),
+                        ('nShow', ctypes.c_int),
+                        ('hInstApp', HINSTANCE),
+                        ('lpIDList', ctypes.c_void_p),
+                        ('lpClass', ctypes.c_char_p),
+                        ('hKeyClass', HKEY),
+                        ('dwHotKey', DWORD),
+                        ('hIcon', HANDLE),
+                        ('hProcess', HANDLE)]
+
+            def __init__(self, **kw):
+                ctypes.Structure.__init__(self)
+                self.cbSize = ctypes.sizeof(self)
+                for name, value in kw.items():
+                    setattr(self, name, value)
+        _shell_execute_info_class = ShellExecuteInfo
+    return _shell_execute_info_class(**kw)
 
-        def __init__(self, **kw):
-            ctypes.Structure.__init__(self)
-            self.cbSize = ctypes.sizeof(self)
-            for name, value in kw.items():
-                setattr(self, name, value)
 
 class SysInfo(object):
     os = None
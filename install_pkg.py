@@ -1,41 +1,111 @@
 #coding=utf-8
-from init import TOOLSFORAI_OS_LINUX, TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_MACOS
+from init import TOOLSFORAI_OS_LINUX, TOOLSFORAI_OS_WIN
 from init import SysInfo
 from init import logger
+import cache
+import install_plan
+import locks
+import scheduler
+import tracing
 import utils
 
-import importlib
+import json
 import os
-import shutil
-import subprocess
+import re
 import sys
+import threading
+
+# Failures of an install group running under the scheduler are collected per thread, then merged in group order.
+_install_state = threading.local()
+
+# Outcome of every package handled in this run by name, for the run summary.
+RESULT_INSTALLED = "installed"
+RESULT_SATISFIED = "satisfied"
+RESULT_FAILED = "failed"
+# Not attempted because a package or group it depends on failed.
+RESULT_SKIPPED = "skipped"
+install_results = {}
+_install_results_lock = threading.Lock()
+
+def _record_result(name, version, status):
+    with _install_results_lock:
+        install_results[name] = {"version": version or "", "status": status}
+
+def _append_fail_install(name, version):
+    _record_result(name, version, RESULT_FAILED)
+    fail_install = getattr(_install_state, "fail_install", None)
+    if fail_install is None:
+        fail_install = SysInfo.fail_install
+    fail_install.append("%s %s" % (name, version))
+
+# Interpreter whose pip installs the packages, another one than this process with --targets.
+python_executable = sys.executable
+
+# Root URL of a mirror of the package index and download hosts, see configure_mirror.
+mirror_base_url = None
+
+def configure_mirror(base_url):
+    # pip uses <base_url>/simple/ as its index, wheel URLs and the CNTK archive are fetched from <base_url>/<host>/<path>.
+    global mirror_base_url
+    mirror_base_url = base_url.rstrip('/') if base_url else None
+    if mirror_base_url:
+        os.environ["PIP_INDEX_URL"] = "{0}/simple/".format(mirror_base_url)
+        logger.info("Use mirror {0}.".format(mirror_base_url))
+
+# Name of the RuntimeSDK in install_results and fail_install.
+CNTK_NAME = "CNTK(BrainScript)"
+
+def cntk_supported():
+    return SysInfo.os in (TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_LINUX)
+
+def cntk_archive():
+    # Returns (version, file name, url) of the CNTK(BrainScript) BinaryDrop archive for SysInfo.
+    if SysInfo.cuda == "8.0":
+        ver = "2.3.1"
+    else:
+        ver = "2.5.1"
+    cntk_file_name = "{}-{}-64bit-{}.{}".format('CNTK-{0}'.format(ver.replace('.', '-')),
+                                                "Windows" if SysInfo.os == TOOLSFORAI_OS_WIN else "Linux",
+                                                "GPU" if SysInfo.gpu else "CPU-Only", "zip" if SysInfo.os == TOOLSFORAI_OS_WIN else "tar.gz")
+    cntk_url = install_plan.mirror_url("https://cntk.ai/BinaryDrop/{0}".format(cntk_file_name), mirror_base_url)
+    return ver, cntk_file_name, cntk_url
 
-def install_cntk(target_dir):
+def _cntk_cancelled(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        logger.warning("CNTK(BrainScript) installation is cancelled.")
+        return True
+    return False
+
+def install_cntk(target_dir, stream=True, archive=None, cancel_event=None, digests=None):
+    # Overlapping installer runs install the RuntimeSDK one after the other, a run that waited for another one
+    # finds the version it installed.
+    lock = locks.named_lock("cntk")
+    if not lock.acquire(cancel_event):
+        _cntk_cancelled(cancel_event)
+        return False
+    try:
+        return _install_cntk(target_dir, stream, archive, cancel_event, digests)
+    finally:
+        lock.release()
+
+def _install_cntk(target_dir, stream, archive, cancel_event, digests):
     logger.info("Begin to install CNTK(BrainScript) ...")
-    if SysInfo.os != TOOLSFORAI_OS_WIN and SysInfo.os != TOOLSFORAI_OS_LINUX:
+    if not cntk_supported():
         logger.warning("CNTK(BrainScript) is not supported on your OS, we recommend 64-bit Windows-10 OS or 64-bit Linux OS.")
         # fail_install.append("CNTK(BrainScript)")
         return False
-    if SysInfo.cuda == "8.0":
-        ver = "2.3.1"
-    else:
-        ver = "2.5.1"
+    ver, cntk_file_name, cntk_url = cntk_archive()
     target_version = 'CNTK-{0}'.format(ver.replace('.', '-'))
     logger.debug("In install_cntk(), target_version: {0}".format(target_version))
     version = utils._get_cntk_version(target_dir)
     if target_version == version:
         logger.info('CNTK(BrainScript)-{0} is already installed.'.format(ver))
+        _record_result(CNTK_NAME, ver, RESULT_SATISFIED)
         return True
     logger.debug('In install_cntk(), target_dir: {0}'.format(target_dir))
+    if _cntk_cancelled(cancel_event):
+        return False
     cntk_root = os.path.join(target_dir, 'cntk')
-    if os.path.isdir(cntk_root):
-        try:
-            shutil.rmtree(cntk_root)
-        except:
-            logger.error('Fail to install CNTK(BrainScript), the error message: can not remove old version in directory {0}.'
-                         'Please manually remove old version, and run the installer script again.'.format(cntk_root))
-            # fail_install.append("CNTK(BrainScript)")
-            return False
     if not os.path.isdir(target_dir):
         try:
             os.makedirs(target_dir)
@@ -44,45 +114,72 @@ def install_cntk(target_dir):
                          'Please check if there is permission for creating directory.'.format(target_dir))
             # fail_install.append("CNTK(BrainScript)")
             return False
-    cntk_file_name = "{}-{}-64bit-{}.{}".format(target_version, "Windows" if SysInfo.os == TOOLSFORAI_OS_WIN else "Linux",
-                                                "GPU" if SysInfo.gpu else "CPU-Only", "zip" if SysInfo.os == TOOLSFORAI_OS_WIN else "tar.gz")
     logger.debug("In install_cntk(), cntk_file_name: {0}".format(cntk_file_name))
-    cntk_url = "https://cntk.ai/BinaryDrop/{0}".format(cntk_file_name)
     logger.debug("In install_cntk(), cntk_url: {0}".format(cntk_url))
     cntk_file_path = os.path.join(target_dir, cntk_file_name)
     logger.debug("In install_cntk(), cntk_file_path: {0}".format(cntk_file_path))
-
-    if SysInfo.os == TOOLSFORAI_OS_WIN:
-        download_dir = cntk_file_path
-    elif SysInfo.os == TOOLSFORAI_OS_LINUX:
-        download_dir = os.path.join(r"/tmp", cntk_file_name)
-    skip_downloading = False
-    if not skip_downloading:
-        if not utils._download_file(cntk_url, download_dir):
+    # digests are the sha256 digests of config.yaml by file name.
+    sha256 = (digests[cntk_file_name],) if digests and cntk_file_name in digests else ()
+    # The new version is staged next to the installed one and swapped in, files it shares with the installed
+    # version are kept instead of written again, see staged_tree.StagedTree.
+    import staged_tree
+    tree = staged_tree.StagedTree(target_dir, 'cntk')
+
+    # Only a cache hit is extracted from disk, a miss streams into the cache while it is extracted.
+    cached_file = archive or (cache.lookup(cntk_url, sha256) if stream else cache.fetch(cntk_url, sha256))
+    if cached_file:
+        if not staged_tree.update_from_archive(tree, cached_file):
+            logger.error('Fail to install CNTK(BrainScript), the error message: cannot decompress the cached package.')
+            # fail_install.append("CNTK(BrainScript)")
+            return False
+    elif stream:
+        suc = cache.download_extract(cntk_url, target_dir, sha256=sha256, extract=tree.extract)
+        try:
+            if suc:
+                tree.commit()
+        except:
+            logger.error("Fail to update {0}. Error: {1}".format(cntk_root, sys.exc_info()))
+            suc = False
+        if not suc:
+            # What was extracted before a failure or a digest mismatch is not kept.
+            tree.abort()
+            logger.error('Fail to install CNTK(BrainScript), the error message: cannot download and decompress {0}.'
+                         'Please check your network.'.format(cntk_url))
+            # fail_install.append("CNTK(BrainScript)")
+            return False
+    else:
+        if SysInfo.os == TOOLSFORAI_OS_WIN:
+            download_dir = cntk_file_path
+        elif SysInfo.os == TOOLSFORAI_OS_LINUX:
+            download_dir = os.path.join(r"/tmp", cntk_file_name)
+        if not utils._download_file(cntk_url, download_dir, segments=4, sha256=sha256):
             logger.error('Fail to install CNTK(BrainScript), the error message: cannot download {0}.'
                          'Please check your network.'.format(cntk_url))
             # fail_install.append("CNTK(BrainScript)")
             return False
 
-    if (not (
-    utils._unzip_file(download_dir, target_dir) if SysInfo.os == TOOLSFORAI_OS_WIN else utils._extract_tar(download_dir, target_dir))):
-        logger.error('Fail to install CNTK(BrainScript), the error message: cannot decompress the downloaded package.')
-        # fail_install.append("CNTK(BrainScript)")
-        return False
+        if not staged_tree.update_from_archive(tree, download_dir):
+            logger.error('Fail to install CNTK(BrainScript), the error message: cannot decompress the downloaded package.')
+            # fail_install.append("CNTK(BrainScript)")
+            return False
 
-    if not skip_downloading:
         if os.path.isfile(download_dir):
             os.remove(download_dir)
 
-    if (SysInfo.os == TOOLSFORAI_OS_WIN):
-        suc = install_cntk_win(cntk_root)
-    else:
-        suc = install_cntk_linux(cntk_root)
+    if _cntk_cancelled(cancel_event):
+        return False
+    # ~/.bashrc and the user PATH are shared by every installer run.
+    with locks.named_lock("env"):
+        if (SysInfo.os == TOOLSFORAI_OS_WIN):
+            suc = install_cntk_win(cntk_root)
+        else:
+            suc = install_cntk_linux(cntk_root)
 
     version = utils._get_cntk_version(target_dir)
     if (suc and (target_version == version)):
         logger.info("Install CNTK(BrainScript) successfully!")
         logger.warning("Please open a new terminal to make the updated Path environment variable effective.")
+        _record_result(CNTK_NAME, ver, RESULT_INSTALLED)
         return True
     else:
         logger.error("Fail to install CNTK(BrainScript).")
@@ -147,36 +244,127 @@ def install_cntk_win(cntk_root):
 
 
 # pip install package
-def pip_install_package(name, options, version, pkg=None):
+def _pip_requirement(name, version, pkg=None):
+    if version is not None:
+        version = str(version)
+    return pkg or install_plan.requirement_spec(name, version), version or ""
+
+def _fetch_wheel(pkg, sha256=()):
+    # Wheel URLs are installed from the artifact cache when it is enabled, verified against the sha256 digests.
+    # Without the cache, pip checks a single digest given as the URL fragment.
+    if pkg.startswith(("http://", "https://")) and pkg.endswith(".whl"):
+        cached_file = cache.fetch(pkg, sha256)
+        if cached_file:
+            return cached_file
+        if len(sha256) == 1:
+            return "{0}#sha256={1}".format(pkg, sha256[0])
+    return pkg
+
+# installed state
+PLAN_SATISFIED = "satisfied"
+PLAN_MISSING = "missing"
+PLAN_VERSION = "version"
+PLAN_VARIANT = "variant"
+PLAN_UNKNOWN = "unknown"
+
+def _same_version(ver1, ver2):
+    to_parts = lambda ver: [int(x) if x.isdigit() else x for x in re.split(r"[.\-_+]", ver.strip().lower())]
+    parts1, parts2 = to_parts(ver1), to_parts(ver2)
+    while parts1 and parts1[-1] == 0:
+        parts1.pop()
+    while parts2 and parts2[-1] == 0:
+        parts2.pop()
+    return parts1 == parts2
+
+def _variant_groups(pkg_info):
+    # Every package with a selector name in config.yaml has GPU/CPU/CUDA variants, e.g. tensorflow-gpu.
+    return [set(utils._canonical_dist_name(name) for name in group) for group in pkg_info.variant_groups()]
+
+# Range operators _version_satisfies evaluates, longest first.
+_VERSION_OPERATORS = (
+    (">=", lambda bound, installed: utils._version_compare(bound, installed)),
+    ("<=", lambda bound, installed: utils._version_compare(installed, bound)),
+    ("==", lambda bound, installed: _same_version(bound, installed)),
+    (">", lambda bound, installed: not utils._version_compare(installed, bound)),
+    ("<", lambda bound, installed: not utils._version_compare(bound, installed)),
+)
+
+def _version_satisfies(version, installed):
+    # Whether installed is the pinned version, or within a range of comma separated clauses such as ">=4.0.0",
+    # None for operators it can not evaluate, e.g. "~=" or "!=".
+    for clause in version.split(","):
+        clause = clause.strip()
+        if "*" in clause:
+            return None
+        if clause and clause[0] not in "<>=!~":
+            if not _same_version(clause, installed):
+                return False
+            continue
+        match = next((operator for operator in _VERSION_OPERATORS if clause.startswith(operator[0])), None)
+        if match is None or clause[len(match[0]):].strip()[:1] in ("", "="):
+            return None
+        if not match[1](clause[len(match[0]):].strip(), installed):
+            return False
+    return True
+
+def requirement_status(name, version, pkg, variant_groups=()):
+    # Returns (status, installed) of one requirement against the installed distributions.
+    installed = utils.installed_version(name)
+    if pkg.startswith("git+"):
+        return PLAN_UNKNOWN, installed
+    if installed is None:
+        canonical = utils._canonical_dist_name(name)
+        for group in variant_groups:
+            if canonical in group:
+                for variant in sorted(group - set([canonical])):
+                    variant_version = utils.installed_version(variant)
+                    if variant_version:
+                        return PLAN_VARIANT, "{0} {1}".format(variant, variant_version)
+        return PLAN_MISSING, None
+    satisfies = _version_satisfies(version, installed) if version else True
+    if satisfies is None:
+        return PLAN_UNKNOWN, installed
+    if not satisfies:
+        return PLAN_VERSION, installed
+    return PLAN_SATISFIED, installed
+
+def pip_install_package(name, options, version, pkg=None, sha256=()):
+    import subprocess
     try:
-        if not pkg:
-            if version:
-                if version.strip()[0] == "<" or version.strip()[0] == ">":
-                    pkg = "{0}{1}".format(name, version)
-                else:
-                    pkg = "{0} == {1}".format(name, version)
-            else:
-                pkg = name
-                version = ""
-        if not version:
-            version = ""
+        pkg, version = _pip_requirement(name, version, pkg)
+        if requirement_status(name, version, pkg)[0] == PLAN_SATISFIED:
+            logger.info("{0} {1} is already installed.".format(name, version))
+            _record_result(name, version, RESULT_SATISFIED)
+            return True
+        pkg = _fetch_wheel(pkg, sha256)
+        if sha256:
+            import tempfile
+            with tempfile.TemporaryDirectory(prefix="toolsforai-") as work_dir:
+                verified, failed = _pip_verified_install([(name, version, pkg)], options, work_dir, {name: sha256})
+            if failed:
+                return False
+            pkg = _installed_requirement(name, verified[name])
         logger.info("Begin to pip-install {0} {1} ...".format(name, version))
         logger.debug("pkg : {0}".format(pkg))
         res = -1
-        res = subprocess.check_call([sys.executable, '-m', 'pip', 'install', *options, "-q", pkg])
+        with tracing.span(name, "pip", requirement=pkg):
+            res = subprocess.check_call([python_executable, '-m', 'pip', 'install', *options, "-q", pkg])
         if res != 0:
             logger.error("Fail to pip-install {0}.".format(name))
-            SysInfo.fail_install.append("%s %s" % (name, version))
+            _append_fail_install(name, version)
         else:
             logger.info("Pip-install {0} {1} successfully!".format(name, version))
+            _record_result(name, version, RESULT_INSTALLED)
+            utils.installed_index.invalidate()
         return res == 0
     except Exception as e:
         # logger.error("Fail to pip-install {0}, unexpected error: {0}".format(name, e))
         logger.error("Fail to pip-install {0}, unexpected error! Please try to run installer script again!".format(name))
-        SysInfo.fail_install.append("%s %s" % (name, version))
+        _append_fail_install(name, version)
         return False
 
 def pip_uninstall_packge(name, options, version):
+    import subprocess
     try:
         if not version:
             version = ""
@@ -185,274 +373,335 @@ def pip_uninstall_packge(name, options, version):
         if len(options_copy) != 0 and options_copy[0] == "--user":
             options_copy.pop(0)
         res = -1
-        res = subprocess.check_call([sys.executable, '-m', 'pip', 'uninstall', *options_copy, "-y", "-q", name])
+        with tracing.span(name, "pip", uninstall=True):
+            res = subprocess.check_call([python_executable, '-m', 'pip', 'uninstall', *options_copy, "-y", "-q", name])
         if res != 0:
             logger.error("Fail to pip-uninstall {0}.".format(name))
         else:
             logger.info("Pip-uninstall {0} {1} successfully!".format(name, version))
+            utils.installed_index.invalidate()
         return res == 0
     except Exception as e:
         # logger.error("Fail to pip-uninstall {0}, unexpected error: {1}".format(name, e))
         logger.error("Fail to pip-uninstall {0}, unexpected error! Please try to run installer script again!".format(name))
         return False
 
-def pip_install_cntk(pkg_info, options):
-    if not ((SysInfo.os == TOOLSFORAI_OS_WIN) or (SysInfo.os == TOOLSFORAI_OS_LINUX)):
-        logger.info("CNTK(Python) can not be supported on your OS, we recommend 64-bit Windows-10 OS or 64-bit Linux OS.")
-        return
-    if SysInfo.gpu:
-        name = pkg_info["cntk"]["name"]["gpu"]
-        if SysInfo.cuda == "8.0":
-            version = pkg_info["cntk"]["cuda80"]
-            wheel_ver = SysInfo.python
-            arch = "win_amd64" if SysInfo.os == TOOLSFORAI_OS_WIN else "linux_x86_64"
-            gpu_type = "GPU" if SysInfo.gpu else "CPU-Only"
-            pkg = "https://cntk.ai/PythonWheel/{0}/cntk-{1}-cp{2}-cp{2}m-{3}.whl".format(gpu_type, version, wheel_ver, arch)
-            return pip_install_package(name, options, version, pkg)
-        elif SysInfo.cuda == "9.0":
-            version = pkg_info["cntk"]["version"]["cuda90"]
-            return pip_install_package(name, options, version)
-    else:
-        name = pkg_info["cntk"]["name"]["cpu"]
-        version = pkg_info["cntk"]["version"]["cpu"]
-        return pip_install_package(name, options, version)
-
-def pip_install_scipy(pkg_info, options):
-    logger.info("Begin to install scipy(numpy, scipy) ...")
-    name = pkg_info["scipy"]["numpy"]["name"]
-    version = pkg_info["scipy"]["numpy"]["version"]
-    if not pip_install_package(name, options, version):
-        logger.error("Pip_install_scipy terminated due to numpy installation failure.")
+# plan execution
+ENTRY_INSTALL = "install"
+ENTRY_UPGRADE = "upgrade"
+ENTRY_KEEP = "keep"
+ENTRY_SKIP = "skip"
+ENTRY_NO_TOOL = "no_tool"
+
+def _installed_satisfies(entry):
+    # Whether the installed version of entry is its pinned version or within its range, see _version_satisfies.
+    installed = utils.installed_version(entry.name)
+    if installed is None:
         return False
-
-    name = pkg_info["scipy"]["scipy"]["name"]
-    version = pkg_info["scipy"]["scipy"]["version"]
-    if not pip_install_package(name, options, version):
-        logger.error("Pip_install_scipy terminated due to scipy installation failure.")
+    return _version_satisfies(entry.version, installed) is not False if entry.version else True
+
+def _entry_status(entry, ignore_installed=False):
+    # What installing one plan entry means on this machine, ignore_installed plans for another machine.
+    keep = not ignore_installed and entry.if_installed == "keep" and _installed_satisfies(entry)
+    if entry.skip:
+        return ENTRY_KEEP if keep else ENTRY_SKIP
+    if entry.requires and not ignore_installed and not getattr(SysInfo, entry.requires, None):
+        return ENTRY_NO_TOOL
+    if keep:
+        return ENTRY_KEEP
+    installed = not ignore_installed and entry.if_installed and utils.package_installed(entry.name)
+    if installed and entry.if_installed == "upgrade":
+        return ENTRY_UPGRADE
+    return ENTRY_INSTALL
+
+def _prepare_entry(entry, options):
+    # Handles everything but the pip install itself, returns the entry status.
+    status = _entry_status(entry)
+    if status == ENTRY_SKIP:
+        logger.warning(entry.skip)
+    elif status == ENTRY_NO_TOOL:
+        _append_fail_install(entry.name, entry.version)
+        logger.warning("Fail to install {0}. Please manually install {1} and run installer script again.".format(
+            entry.name, entry.requires))
+    elif status == ENTRY_KEEP:
+        logger.info("{0} is already installed.".format(entry.name))
+        _record_result(entry.name, entry.version, RESULT_SATISFIED)
+    elif status == ENTRY_UPGRADE:
+        logger.info("{0} is already installed. We will uninstall it and upgrade to the latest version.".format(entry.name))
+        pip_uninstall_packge(entry.name, options, entry.version)
+    return status
+
+def _record_skipped(entries, fail_install):
+    # Skipped packages count as not installed, in the summary and in the exit code.
+    for entry in entries:
+        if entry.skip:
+            continue
+        _record_result(entry.name, entry.version, RESULT_SKIPPED)
+        fail_install.append("%s %s (skipped)" % (entry.name, entry.version))
+
+def _install_entry(entry, options):
+    status = _prepare_entry(entry, options)
+    if status in (ENTRY_SKIP, ENTRY_KEEP):
+        return True
+    if status == ENTRY_NO_TOOL:
         return False
-    return True
+    if pip_install_package(entry.name, options, entry.version, entry.source, entry.sha256):
+        return True
+    if entry.hint:
+        logger.warning(entry.hint)
+    return False
 
-def pip_install_tensorflow(pkg_info, options):
-    if SysInfo.gpu:
-        name = pkg_info["tensorflow"]["name"]["gpu"]
-        if SysInfo.cuda == "8.0":
-            if SysInfo.os == TOOLSFORAI_OS_WIN:
-                version = pkg_info["tensorflow"]["version"]["cuda80"]["win"]
-            elif SysInfo.os == TOOLSFORAI_OS_LINUX:
-                version = pkg_info["tensorflow"]["version"]["cuda80"]["linux"]
-        else:
-            version = pkg_info["tensorflow"]["version"]["cuda90"]
-    else:
-        name = pkg_info["tensorflow"]["name"]["cpu"]
-        version = pkg_info["tensorflow"]["version"]["cpu"]
-    return pip_install_package(name, options, version)
-
-def pip_install_pytorch(pkg_info, options):
-    name = pkg_info["pytorch"]["torch"]["name"]
-    version = pkg_info["pytorch"]["torch"]["version"]
-    if SysInfo.os == TOOLSFORAI_OS_MACOS:
-        pip_install_package(name, options, version)
-    elif SysInfo.os == TOOLSFORAI_OS_WIN or SysInfo.os == TOOLSFORAI_OS_LINUX:
-        wheel_ver = SysInfo.python
-        arch = "win_amd64" if SysInfo.os == TOOLSFORAI_OS_WIN else "linux_x86_64"
-        if not SysInfo.gpu:
-            gpu_type = "cpu"
-        else:
-            gpu_type = "cu80" if SysInfo.cuda == "8.0" else "cu90"
-        pkg = "http://download.pytorch.org/whl/{0}/{1}-{2}-cp{3}-cp{3}m-{4}.whl".format(gpu_type, name, version, wheel_ver, arch)
-        pip_install_package(name, options, version, pkg)
-    else:
-        logger.error("Fail to install pytorch.")
-        logger.warning("Pytorch installation can not be supported on your OS! We recommand 64-bit Windows-10, Linux and Macos.")
-
-    name = pkg_info["pytorch"]["torchvision"]["name"]
-    version = pkg_info["pytorch"]["torchvision"]["version"]
-    pip_install_package(name, options, version)
-
-def pip_install_keras(pkg_info, options):
-    name = pkg_info["Keras"]["name"]
-    version = pkg_info["Keras"]["version"]
-    return pip_install_package(name, options, version)
-
-def pip_install_caffe2(pkg_info, options):
-    if not (SysInfo.os == TOOLSFORAI_OS_WIN):
-        logger.warning("Fail to install caffe2. In non-Windows OS, you should manually install caffe2 from source.")
-        return
-    name = pkg_info["caffe2"]["name"]
-    version = pkg_info["caffe2"]["version"]
-    arch = "win_amd64"
-    wheel_ver = SysInfo.python
-    if SysInfo.gpu and SysInfo.cuda == "8.0":
-        pkg = "https://raw.githubusercontent.com/linmajia/ai-package/master/caffe2/{0}/caffe2_gpu-{0}-cp{1}-cp{1}m-{2}.whl".format(
-            version, wheel_ver, arch)
-    else:
-        pkg = "https://raw.githubusercontent.com/linmajia/ai-package/master/caffe2/{0}/caffe2-{0}-cp{1}-cp{1}m-{2}.whl".format(
-            version, wheel_ver, arch)
-    return pip_install_package(name, options, version, pkg)
-
-def pip_install_theano(pkg_info, options):
-    name = pkg_info["Theano"]["name"]
-    version = pkg_info["Theano"]["version"]
-    return pip_install_package(name, options, version)
-
-def pip_install_mxnet(pkg_info, options):
-    version = pkg_info["mxnet"]["version"]
-    if SysInfo.gpu:
-        if SysInfo.cuda == "8.0":
-            name = pkg_info["mxnet"]["name"]["gpu"]["cuda80"]
-        else:
-            name = pkg_info["mxnet"]["name"]["gpu"]["cuda90"]
-    else:
-        name =  pkg_info["mxnet"]["name"]["cpu"]
-
-    return pip_install_package(name, options, version)
-
-def pip_install_chainer(pkg_info, options):
-    # cupy installation for GPU linux
-    logger.info("Begin to install chainer(cupy, chainer, chainermn) ...")
-    version = pkg_info["chainer"]["cupy"]["version"]
-    if (SysInfo.gpu and (SysInfo.os == TOOLSFORAI_OS_LINUX)):
-        if SysInfo.cuda == "8.0":
-            name = pkg_info["chainer"]["cupy"]["name"]["linux"]["cuda80"]
-        elif SysInfo.cuda == "9.0":
-            name = pkg_info["chainer"]["cupy"]["name"]["linux"]["cuda90"]
-        else:
-            name = pkg_info["chainer"]["cupy"]["name"]["linux"]["other"]
-        pip_install_package(name, options)
-    elif (SysInfo.gpu and (SysInfo.os == TOOLSFORAI_OS_WIN)):
+def _install_plan_group(name, entries, options, fail_install):
+    def run():
+        _install_state.fail_install = fail_install
         try:
-            name = pkg_info["chainer"]["cupy"]["name"]["win"]
-            cupy = importlib.import_module(name)
-            if (not utils._version_compare(version, cupy.__version__)):
-                logger.warning("Cupy's version is too low, please manually upgrade cupy >= 2.0.0.")
-            else:
-                logger.info("cupy is already installed.")
-        except ImportError:
-            logger.warning("On windows, please manully install cupy. You can reference this link https://github.com/Microsoft/vs-tools-for-ai/blob/master/docs/prepare-localmachine.md#chainer.")
-
-    name = pkg_info["chainer"]["chainer"]["name"]
-    version = pkg_info["chainer"]["chainer"]["version"]
-    pip_install_package(name, options, version)
-
-    name = pkg_info["chainer"]["chainermn"]["name"]
-    version = pkg_info["chainer"]["chainermn"]["version"]
-    if not pip_install_package(name, options, version):
-        logger.warning("On Linux, in order to install chainermn, please first manually install libmpich-dev and then run installer script again.")
-
-def pip_install_converter(pkg_info, options):
-    logger.info("Begin to install converter(coremltools, onnx, tf2onnx, onnxmltools and winmltools) ...")
+            with tracing.span(name, "group"):
+                if len(entries) > 1:
+                    logger.info("Begin to install {0}({1}) ...".format(name, ", ".join(entry.name for entry in entries)))
+                suc = True
+                for i, entry in enumerate(entries):
+                    if not _install_entry(entry, options):
+                        suc = False
+                        if entry.stop_on_failure:
+                            logger.error("Installing {0} terminated due to {1} installation failure.".format(name, entry.name))
+                            _record_skipped(entries[i + 1:], fail_install)
+                            break
+                return suc
+        finally:
+            _install_state.fail_install = None
+    return run
+
+def run_plan(plan, options, jobs=1):
+    # Serial (jobs=1) or parallel executor: every group is a scheduler group, packages of a group run in order.
+    groups = plan.by_group()
+    fail_records = {name: [] for name, _, _ in groups}
+    install_groups = [scheduler.InstallGroup(name, _install_plan_group(name, entries, options, fail_records[name]), deps)
+                      for name, deps, entries in groups]
+    results = scheduler.run_groups(install_groups, jobs)
+    for name, _, entries in groups:
+        if results[name][0] == scheduler.GROUP_STATUS_SKIP:
+            _record_skipped(entries, fail_records[name])
+        SysInfo.fail_install.extend(fail_records[name])
+    return results
+
+def run_plan_batch(plan, options):
+    # Batched executor: one pip resolve for every entry that is not skipped, see pip_batch_install.
+    requirements = []
+    hashes = {}
+    for entry in plan:
+        if _prepare_entry(entry, options) in (ENTRY_INSTALL, ENTRY_UPGRADE):
+            requirements.append((entry.name, entry.version or "", _fetch_wheel(entry.spec, entry.sha256)))
+            if entry.sha256:
+                hashes[entry.name] = entry.sha256
+    return pip_batch_install(requirements, options, hashes)
+
+# batch install
+def _canonical_name(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+_PIP_ERROR_LINE = re.compile(r"^\s*(ERROR|error|Failed|× )", re.M)
+_PIP_NAME_TOKEN = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+
+def _parse_pip_failures(output, requirements):
+    # Map pip's error lines back to the requirements they mention, either by name or by direct URL.
+    failed = []
+    for line in output.split('\n'):
+        if not _PIP_ERROR_LINE.match(line):
+            continue
+        tokens = set(_canonical_name(token) for token in _PIP_NAME_TOKEN.findall(line))
+        for requirement in requirements:
+            name, _, pkg = requirement
+            if requirement in failed:
+                continue
+            url = pkg.split(" @ ")[-1] if "://" in pkg else None
+            if _canonical_name(name) in tokens or (url and url.rstrip('/').rsplit('/', 1)[-1] in line):
+                failed.append(requirement)
+    return [requirement for requirement in requirements if requirement in failed]
+
+_PIP_HASH_ERROR = "DO NOT MATCH THE HASHES"
+
+def _parse_pip_hash_failures(output, requirements):
+    # pip lists every artifact with another digest after its hash error, indented, e.g.
+    # "    tf2onnx==0.0.0.1 from https://.../tf2onnx-0.0.0.1-py3-none-any.whl:".
+    if _PIP_HASH_ERROR not in output:
+        return []
+    lines = output[output.index(_PIP_HASH_ERROR):].split('\n')[1:]
+    return _parse_pip_failures("\n".join("ERROR: " + line for line in lines if " from " in line), requirements)
+
+def _parse_pip_report(report_path):
+    # {canonical name: version} of what pip installed.
     try:
-        #1 coremltools
-        name = pkg_info["converter"]["coremltools"]["name"]
-        version = pkg_info["converter"]["coremltools"]["version"]
-        if SysInfo.os == TOOLSFORAI_OS_WIN:
-            if SysInfo.git:
-                pkg = "git+https://github.com/apple/coremltools@v0.8"
-                pip_install_package(name, options, version, pkg)
-            else:
-                SysInfo.fail_install.append("%s %s" % (name, version))
-                logger.warning("Fail to install {0}. Please manually install git and run installer script again.".format(name))
-        else:
-            pip_install_package(name, options, version)
-
-        #2 onnx
-        name = pkg_info["converter"]["onnx"]["name"]
-        version = pkg_info["converter"]["onnx"]["version"]
-        pip_install_package(name, options, version)
-
-        #3 tf2onnx
-        name = pkg_info["converter"]["tf2onnx"]["name"]
-        version = pkg_info["converter"]["tf2onnx"]["version"]
-        if not SysInfo.git:
-            utils.fail_install.append("%s %s" % (name, version))
-            logger.warning("Fail to install {0}. Please manually install git and run installer script again.".format(name))
-        else:
-            pkg = "git+https://github.com/onnx/tensorflow-onnx.git@r0.1"
-            if utils.module_exists(name):
-                logger.info("{0} is already installed. We will uninstall it and upgrade to the latest version.".format(name))
-                pip_uninstall_packge(name, options, version)
-            pip_install_package(name, options, version, pkg)
-
-        #4 onnxmltools
-        name = pkg_info["converter"]["onnxmltools"]["name"]
-        version = pkg_info["converter"]["onnxmltools"]["version"]
-        if utils.module_exists(name):
-            logger.info("{0} is already installed.".format(name))
-        else:
-            pip_install_package(name, options, version)
-
-        #5 winmltools
-        name = pkg_info["converter"]["winmltools"]["name"]
-        version = pkg_info["converter"]["winmltools"]["version"]
-        if utils.module_exists(name):
-            logger.info("{0} is already installed.".format(name))
-        else:
-            pip_install_package(name, options, version)
+        with open(report_path) as fin:
+            report = json.load(fin)
+        return dict((_canonical_name(item["metadata"]["name"]), item["metadata"]["version"])
+                    for item in report.get("install", []))
     except Exception as e:
-        logger.error("Fail to install converter, unexpected error! Please run installer again!")
-
-def pip_install_ml_software(pkg_info, options):
-    logger.info("Begin to install ml software(scikit-learn, xgboost and libsvm) ...")
-
-    #1 scikit-learn
-    name = pkg_info["ml_software"]["scikit-learn"]["name"]
-    version = pkg_info["ml_software"]["scikit-learn"]["version"]
-    pip_install_package(name, options, version)
-
-    #2 xgboost
-    name = pkg_info["ml_software"]["xgboost"]["name"]
-    version = pkg_info["ml_software"]["xgboost"]["version"]
-    if SysInfo.os != TOOLSFORAI_OS_WIN:
-        if not pip_install_package(name, options, version):
-            logger.warning("In order to install xgboost, C++ compiler is needed.")
-    else:
-        wheel_ver = SysInfo.python
-        arch = "win_amd64"
-        pkg = "https://raw.githubusercontent.com/linmajia/ai-package/master/xgboost/{0}/xgboost-{0}-cp{1}-cp{1}m-{2}.whl".format(version, wheel_ver, arch)
-        pip_install_package(name, options, version, pkg)
-
-    #3 libsvm
-    name = pkg_info["ml_software"]["libsvm"]["name"]
-    version = pkg_info["ml_software"]["libsvm"]["version"]
-    if SysInfo.os != TOOLSFORAI_OS_WIN:
-        logger.warning(
-            "Fail to install libsvm. On Linux or Mac, in order to install {0}=={1}, please manually download source code and install it.".format(
-                name, version))
-    else:
-        wheel_ver = SysInfo.python
-        arch = "win_amd64"
-        pkg = "https://raw.githubusercontent.com/linmajia/ai-package/master/libsvm/{0}/libsvm-{0}-cp{1}-cp{1}m-{2}.whl".format(version, wheel_ver, arch)
-        logger.debug("Pip install libsvm from {0}".format(pkg))
-        pip_install_package(name, options, version, pkg)
-
-def pip_install_extra_software(pkg_info, options):
-    logger.info("Begin to install extra software(jupyter, matplotlib, and pandas) ...")
-
-    #1 jupyter
-    name = pkg_info["extra_software"]["jupyter"]["name"]
-    version = pkg_info["extra_software"]["jupyter"]["version"]
-    if utils.module_exists(name):
-        logger.info("{0} is already installed.".format(name))
-    else:
-        pip_install_package(name, options, version)
-
-    #2 matplotlib
-    name = pkg_info["extra_software"]["matplotlib"]["name"]
-    version = pkg_info["extra_software"]["matplotlib"]["version"]
-    if utils.module_exists(name):
-        logger.info("{0} is already installed.".format(name))
-    else:
-        pip_install_package(name, options, version)
-
-    #3 pandas
-    name = pkg_info["extra_software"]["pandas"]["name"]
-    version = pkg_info["extra_software"]["pandas"]["version"]
-    if utils.module_exists(name):
-        logger.info("{0} is already installed.".format(name))
-    else:
-        pip_install_package(name, options, version)
-
-def pip_software_install(pkg_info, options, user, verbose):
+        logger.debug("Fail to parse pip report {0}, unexpected error: {1}".format(report_path, e))
+        return {}
+
+def _pip_supports_report():
+    status, stdout = utils._run_cmd(python_executable, ['-m', 'pip', '--version'], True)
+    match = re.search(r"pip (\d+)\.(\d+)", stdout) if status else None
+    return bool(match) and (int(match.group(1)), int(match.group(2))) >= (22, 2)
+
+def _pip_batch_line(name, pkg):
+    # Direct URLs and cached wheels are written as PEP 508 references so that pip reports them by project name.
+    if pkg.endswith(".whl") and os.path.isfile(pkg):
+        import pathlib
+        return "{0} @ {1}".format(name, pathlib.Path(os.path.abspath(pkg)).as_uri())
+    if "://" in pkg and " @ " not in pkg:
+        return "{0} @ {1}".format(name, pkg)
+    return pkg.replace(" ", "")
+
+def _pip_batch_run(requirements, options, work_dir, use_report, hashes=None):
+    # With hashes, only the requirements are installed, in pip's hash-checking mode: an artifact with another
+    # sha256 than config.yaml fails before anything is installed.
+    import runner
+    requirements_path = os.path.join(work_dir, "requirements.txt")
+    report_path = os.path.join(work_dir, "report.json")
+    with open(requirements_path, 'w') as fout:
+        for name, _, pkg in requirements:
+            line = _pip_batch_line(name, pkg)
+            if hashes is not None:
+                line = " ".join([line] + ["--hash=sha256:{0}".format(digest) for digest in hashes.get(name, ())])
+            fout.write("{0}\n".format(line))
+    if os.path.isfile(report_path):
+        os.remove(report_path)
+    args = ['-m', 'pip', 'install', *options, '-r', requirements_path]
+    if hashes is not None:
+        args.extend(['--no-deps', '--require-hashes'])
+    if use_report:
+        args.extend(['--report', report_path])
+    logger.debug("Batch pip command: {0} {1}".format(python_executable, " ".join(args)))
+    with tracing.span("batch", "pip", requirements=len(requirements)):
+        # pip's errors come last, so the bounded tail of the output is enough to attribute them.
+        result = runner.run(python_executable, args, name="pip", merge_stderr=True)
+    installed = _parse_pip_report(report_path) if result.returncode == 0 and use_report else {}
+    return result.returncode == 0, "\n".join(result.stdout), installed
+
+def _pip_verified_install(requirements, options, work_dir, hashes, use_report=False):
+    # Installs the requirements with sha256 digests in config.yaml before their dependencies, which have none, see
+    # _pip_batch_run. Returns ({name: installed version}, failed requirements).
+    pending = [requirement for requirement in requirements if hashes.get(requirement[0])]
+    failed = []
+    while pending:
+        logger.info("Begin to pip-install {0} packages with sha256 digests ...".format(len(pending)))
+        suc, output, installed = _pip_batch_run(pending, options, work_dir, use_report, hashes)
+        if suc:
+            return dict((name, installed.get(_canonical_name(name), version)) for name, version, _ in pending), failed
+        newly_failed = _parse_pip_hash_failures(output, pending) or _parse_pip_failures(output, pending) \
+            or list(pending)
+        for requirement in newly_failed:
+            logger.error("Fail to pip-install {0}.".format(requirement[0]))
+            pending.remove(requirement)
+            failed.append(requirement)
+            _append_fail_install(requirement[0], requirement[1])
+    return {}, failed
+
+def _installed_requirement(name, version):
+    # name == its installed version after _pip_verified_install: pip finds it installed, keeps the verified
+    # artifact and only adds its dependencies.
+    utils.installed_index.invalidate()
+    return install_plan.requirement_spec(name, utils.installed_version(name) or version).replace(" ", "")
+
+def pip_batch_install(requirements, options, hashes=None):
+    # Install all requirements with one pip resolve. When pip fails, the requirements named in its errors
+    # are recorded as failed and the rest is retried; unattributable failures fall back to per-package installs.
+    # hashes are the expected sha256 digests by name, see _pip_verified_install.
+    hashes = hashes or {}
+    satisfied = [requirement for requirement in requirements if requirement_status(*requirement)[0] == PLAN_SATISFIED]
+    for name, version, _ in satisfied:
+        logger.info("{0} {1} is already installed.".format(name, version))
+        _record_result(name, version, RESULT_SATISFIED)
+    requirements = [requirement for requirement in requirements if requirement not in satisfied]
+    if not requirements:
+        return True
+    logger.info("Begin to pip-install {0} packages in batch mode ...".format(len(requirements)))
+    import tempfile
+    use_report = _pip_supports_report()
+    # Without pip's report (pip < 22.2), what pip installed is told by the installed versions before and after.
+    before = {} if use_report else dict((name, utils.installed_version(name)) for name, _, _ in requirements)
+    with tempfile.TemporaryDirectory(prefix="toolsforai-") as work_dir:
+        verified, failed = _pip_verified_install(requirements, options, work_dir, hashes, use_report)
+        for name, version in verified.items():
+            logger.info("Pip-install {0} {1} successfully!".format(name, version))
+            _record_result(name, version, RESULT_INSTALLED)
+        # The verified requirements stay in the batch for their dependencies.
+        pending = [(name, version, _installed_requirement(name, verified[name]) if name in verified else pkg)
+                   for name, version, pkg in requirements if (name, version, pkg) not in failed]
+        while pending:
+            suc, output, installed = _pip_batch_run(pending, options, work_dir, use_report)
+            if suc:
+                utils.installed_index.invalidate()
+                for name, version, pkg in pending:
+                    if name in verified:
+                        continue
+                    installed_version = installed.get(_canonical_name(name))
+                    if not use_report:
+                        installed_version = utils.installed_version(name)
+                        if installed_version == before[name]:
+                            installed_version = None
+                    if installed_version:
+                        logger.info("Pip-install {0} {1} successfully!".format(name, installed_version))
+                        _record_result(name, installed_version, RESULT_INSTALLED)
+                    else:
+                        logger.info("{0} {1} is already installed.".format(name, version))
+                        _record_result(name, version, RESULT_SATISFIED)
+                break
+            newly_failed = _parse_pip_failures(output, pending)
+            if not newly_failed:
+                logger.warning("Fail to attribute batch pip-install errors, falling back to per-package pip-install.")
+                for name, version, pkg in pending:
+                    if name in verified:
+                        continue
+                    if not pip_install_package(name, options, version, pkg, hashes.get(name, ())):
+                        failed.append((name, version, pkg))
+                pending = []
+                break
+            for requirement in newly_failed:
+                logger.error("Fail to pip-install {0}.".format(requirement[0]))
+                pending.remove(requirement)
+                failed.append(requirement)
+                _append_fail_install(requirement[0], requirement[1])
+    return not failed
+
+def target_plan(pkg_info, groups=None):
+    return install_plan.build_plan(pkg_info, SysInfo.os, SysInfo.gpu, SysInfo.cuda, SysInfo.python, groups, mirror_base_url)
+
+def pip_collect_requirements(pkg_info, options, ignore_installed=False, groups=None):
+    # (name, version, pkg) of every package pip is asked for, in install order, with wheels from the cache.
+    return [(entry.name, entry.version or "", _fetch_wheel(entry.spec, entry.sha256)) for entry in target_plan(pkg_info, groups)
+            if _entry_status(entry, ignore_installed) in (ENTRY_INSTALL, ENTRY_UPGRADE)]
+
+def pip_plan(pkg_info, options, groups=None):
+    # Returns [(name, version, pkg, status, installed)] of the install plan on this machine, in install order.
+    variant_groups = _variant_groups(pkg_info)
+    plan = []
+    for entry in target_plan(pkg_info, groups):
+        status = _entry_status(entry)
+        if status == ENTRY_KEEP:
+            plan.append((entry.name, entry.version or "", entry.spec, PLAN_SATISFIED, utils.installed_version(entry.name)))
+        elif status in (ENTRY_INSTALL, ENTRY_UPGRADE):
+            plan.append((entry.name, entry.version or "", entry.spec) +
+                        requirement_status(entry.name, entry.version or "", entry.spec, variant_groups))
+    return plan
+
+def print_plan(plan):
+    marks = {PLAN_SATISFIED: "=", PLAN_MISSING: "+", PLAN_VERSION: "~", PLAN_VARIANT: "!", PLAN_UNKNOWN: "?"}
+    for name, version, pkg, status, installed in plan:
+        line = "{0} {1}".format(marks[status], _pip_batch_line(name, pkg))
+        if status == PLAN_VERSION:
+            line += " (installed {0})".format(installed)
+        elif status == PLAN_VARIANT:
+            line += " (installed variant {0})".format(installed)
+        elif status == PLAN_UNKNOWN:
+            line += " (always passed to pip{0})".format(", installed {0}".format(installed) if installed else "")
+        print(line)
+    changes = len([item for item in plan if item[3] != PLAN_SATISFIED])
+    print("{0} of {1} packages to install.".format(changes, len(plan)))
+    return changes
+
+def _pip_options(options, user, verbose):
     pip_ops = []
     if options:
         pip_ops = options.split()
@@ -460,16 +709,21 @@ def pip_software_install(pkg_info, options, user, verbose):
         pip_ops = ["--user"]
     if not verbose:
         pip_ops.append("-q")
-    if not pip_install_scipy(pkg_info, pip_ops):
-        return
-    pip_install_cntk(pkg_info, pip_ops)
-    pip_install_tensorflow(pkg_info, pip_ops)
-    pip_install_pytorch(pkg_info, pip_ops)
-    pip_install_mxnet(pkg_info, pip_ops)
-    pip_install_chainer(pkg_info, pip_ops)
-    pip_install_theano(pkg_info, pip_ops)
-    pip_install_keras(pkg_info, pip_ops)
-    pip_install_caffe2(pkg_info, pip_ops)
-    pip_install_ml_software(pkg_info, pip_ops)
-    pip_install_converter(pkg_info, pip_ops)
-    pip_install_extra_software(pkg_info, pip_ops)
\ No newline at end of file
+    return pip_ops
+
+def pip_lock():
+    # Installer runs that pip-install into the same interpreter run one after the other. The installed state is
+    # read again once the lock is held, so that a run that waited skips what the other run installed.
+    import hashlib
+    key = hashlib.sha256(os.path.abspath(python_executable).encode('utf-8')).hexdigest()[:12]
+    logger.debug("pip lock of {0}: pip-{1}".format(python_executable, key))
+    return locks.named_lock("pip-{0}".format(key))
+
+def pip_software_install(pkg_info, options, user, verbose, jobs=1, batch=False, groups=None):
+    pip_ops = _pip_options(options, user, verbose)
+    plan = target_plan(pkg_info, groups)
+    with pip_lock():
+        utils.installed_index.invalidate()
+        if batch:
+            return run_plan_batch(plan, pip_ops)
+        return run_plan(plan, pip_ops, jobs)
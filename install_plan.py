@@ -0,0 +1,74 @@
+#coding=utf-8
+import collections
+import re
+
+# One package to install. spec is the requirement passed to pip, source the wheel URL or VCS reference it is
+# built from (None for the package index) and depends the groups that must be installed before its group.
+# skip, requires, if_installed, hint and stop_on_failure are the resolved config.yaml fields. sha256 are the
+# expected digests of what is installed, from the digests of config.yaml: the file of a URL source, or any file of
+# a pinned index requirement.
+PlanEntry = collections.namedtuple("PlanEntry", ["group", "name", "version", "spec", "source", "depends", "skip",
+                                                 "requires", "if_installed", "hint", "stop_on_failure", "sha256"])
+
+
+def requirement_spec(name, version):
+    if not version:
+        return name
+    if version.strip()[0] in "<>":
+        return "{0}{1}".format(name, version)
+    return "{0} == {1}".format(name, version)
+
+
+def mirror_url(url, base_url):
+    # https://host/path of a mirror is <base_url>/host/path. Other sources, e.g. git+https, are not mirrored.
+    match = re.match(r"https?://(.+)$", url)
+    if not base_url or not match:
+        return url
+    return "{0}/{1}".format(base_url.rstrip('/'), match.group(1))
+
+
+class InstallPlan(object):
+    # Everything config.yaml selects for one target, computed before anything is installed. It does not look
+    # at the machine, whether a package is installed or a tool is missing is up to the executor.
+    __slots__ = ("target", "groups", "entries")
+
+    def __init__(self, target, groups, entries):
+        self.target = dict(target)
+        self.groups = tuple(groups)
+        self.entries = tuple(entries)
+
+    def by_group(self):
+        # [(group, depends, entries)] in install order, groups without entries for the target included.
+        return [(name, depends, tuple(entry for entry in self.entries if entry.group == name))
+                for name, depends in self.groups]
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def build_plan(config, os_name, gpu, cuda, python, groups=None, base_url=None):
+    # groups limits the plan to some group names, see Config.select_groups. URL sources are fetched from the
+    # mirror at base_url when given.
+    target = {"os": os_name, "gpu": gpu, "cuda": cuda, "python": python}
+    config_groups = [group for group in config.groups if groups is None or group.name in groups]
+    entries = []
+    # Packages not available for the target, e.g. cupy without GPU, are left out.
+    for group, package, fields in config.resolve(os_name, gpu, cuda, python, groups):
+        source, skip, hint = fields["source"], fields["skip"], fields["hint"]
+        if source and re.match(r"https?://", source):
+            digest = config.digest(source.rstrip('/').rsplit('/', 1)[-1])
+            sha256 = (digest,) if digest else ()
+        elif not source and fields["version"] and fields["version"].strip()[0] not in "<>":
+            sha256 = config.dist_digests(fields["name"], fields["version"])
+        else:
+            sha256 = ()
+        if source:
+            source = mirror_url(source, base_url)
+        entries.append(PlanEntry(group.name, fields["name"], fields["version"],
+                                 source or requirement_spec(fields["name"], fields["version"]), source,
+                                 group.depends, skip, fields["requires"], fields["if_installed"], hint,
+                                 package.stop_on_failure, sha256))
+    return InstallPlan(target, [(group.name, group.depends) for group in config_groups], entries)
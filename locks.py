@@ -0,0 +1,133 @@
+#coding=utf-8
+from init import logger
+import tracing
+
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+LOCK_POLL_INTERVAL = 0.2
+# How often a waiting run logs which run it is waiting for.
+LOCK_WAIT_LOG_INTERVAL = 60
+STATE_NAME = "state.json"
+
+_state_lock = threading.Lock()
+
+
+def toolsforai_dir():
+    return os.path.sep.join([os.path.expanduser('~'), '.toolsforai'])
+
+
+def lock_dir():
+    return os.path.join(toolsforai_dir(), "locks")
+
+
+def _try_lock(fout):
+    # Non-blocking exclusive lock of an open file, released by the OS when the process exits.
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+            fout.seek(0)
+            msvcrt.locking(fout.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fout.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except (IOError, OSError):
+        return False
+    return True
+
+
+def _unlock(fout):
+    if sys.platform == "win32":
+        import msvcrt
+        fout.seek(0)
+        msvcrt.locking(fout.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+        fcntl.flock(fout.fileno(), fcntl.LOCK_UN)
+
+
+class FileLock(object):
+    # Exclusive lock of a file shared by every installer run on the machine, also by threads of one run (the lock
+    # is not reentrant). A named lock records its holder in the state database, so that a waiting run can tell
+    # which run it waits for, and that one finished.
+    def __init__(self, path, name=None):
+        self.path = path
+        self.name = name
+        self.fout = None
+
+    def acquire(self, cancel_event=None):
+        # Waits until the lock is free, returns False when cancel_event is set in the meantime.
+        if not os.path.isdir(os.path.dirname(self.path)):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fout = open(self.path, 'a+')
+        if not _try_lock(fout):
+            holder = read_state().get("locks", {}).get(self.name) if self.name else None
+            with tracing.span(self.name or os.path.basename(self.path), "lock"):
+                next_log = time.time()
+                while not _try_lock(fout):
+                    if cancel_event is not None and cancel_event.is_set():
+                        fout.close()
+                        return False
+                    if self.name and time.time() >= next_log:
+                        logger.info("Waiting for {0}, another installer run {1}is working on it ...".format(
+                            self.name, "(pid {0}, since {1}) ".format(holder["pid"], time.strftime(
+                                "%H:%M:%S", time.localtime(holder["since"]))) if holder else ""))
+                        next_log += LOCK_WAIT_LOG_INTERVAL
+                    time.sleep(LOCK_POLL_INTERVAL)
+            if self.name:
+                logger.info("Another installer run finished {0}, reuse its results.".format(self.name))
+        self.fout = fout
+        if self.name:
+            update_state(lambda state: state.setdefault("locks", {}).__setitem__(self.name, {
+                "pid": os.getpid(), "host": platform.node(), "since": time.time(), "argv": " ".join(sys.argv)}))
+        return True
+
+    def release(self):
+        if self.fout is None:
+            return
+        if self.name:
+            update_state(lambda state: state.setdefault("locks", {}).pop(self.name, None))
+        try:
+            _unlock(self.fout)
+        finally:
+            self.fout.close()
+            self.fout = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+def named_lock(name):
+    # e.g. "env" for ~/.bashrc and the user environment, "cntk" for the RuntimeSDK, "pip-<interpreter>".
+    return FileLock(os.path.join(lock_dir(), "{0}.lock".format(name)), name)
+
+
+def state_path():
+    return os.path.join(toolsforai_dir(), STATE_NAME)
+
+
+def read_state():
+    try:
+        with open(state_path()) as fin:
+            return json.load(fin)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def update_state(func):
+    # func(state) changes the state database in place, under its own file lock.
+    with _state_lock, FileLock(os.path.join(lock_dir(), "state.lock")):
+        state = read_state()
+        func(state)
+        tmp_path = "{0}.{1}.tmp".format(state_path(), os.getpid())
+        with open(tmp_path, 'w') as fout:
+            json.dump(state, fout, indent=2, sort_keys=True)
+        os.replace(tmp_path, state_path())
@@ -1,32 +1,56 @@
 #coding=utf-8
 from init import TOOLSFORAI_OS_LINUX, TOOLSFORAI_OS_WIN
+from init import EXIT_SUCCESS, EXIT_FAILURE, EXIT_DETECT_FAIL, EXIT_PARTIAL_INSTALL
 from init import SysInfo
 from init import logger, set_options
+import cache
 import install_pkg
+import locks
+import pkg_config
+import scheduler
+import targets
+import tracing
 import utils
 
+import atexit
+import json
 import logging
 import os
-import _thread
+import sys
+import time
 
 
+def write_summary(path, exit_code, start):
+    summary = {
+        "exit_code": exit_code,
+        "duration": round(time.time() - start, 3),
+        "sysinfo": dict((field, getattr(SysInfo, field)) for field in ["os", "python", "gpu", "cuda", "cudnn", "cuda80", "git", "mpi"]),
+        "fail_install": SysInfo.fail_install,
+        "packages": dict(sorted(install_pkg.install_results.items())),
+    }
+    if targets.target_results:
+        summary["targets"] = targets.target_results
+    try:
+        with open(path, 'w') as fout:
+            json.dump(summary, fout, indent=2)
+    except Exception as e:
+        logger.error("Fail to write summary {0}, unexpected error: {1}".format(path, e))
+
 def main():
+    start = time.time()
     args, unknown = set_options()
     if args.verbose:
         logger.setLevel(logging.DEBUG)
     if args.cuda80:
         SysInfo.cuda80 = True
+    if args.trace:
+        atexit.register(tracing.write_report, args.trace)
 
     logger.info("Detecting system information ...")
-    if not utils.detect_os() or not utils.detect_python_version() or not utils.detect_gpu():
-        return
-    utils.detect_git()
-    if (SysInfo.os == TOOLSFORAI_OS_WIN):
-        utils.detect_vs()
-    if (SysInfo.gpu):
-        if not utils.detect_cuda():
-            return
-        utils.detect_cudnn()
+    if not utils.detect_system(args.refresh_detect):
+        if args.summary:
+            write_summary(args.summary, EXIT_DETECT_FAIL, start)
+        return EXIT_DETECT_FAIL
 
     target_dir = ''
     if SysInfo.os == TOOLSFORAI_OS_WIN:
@@ -35,18 +59,80 @@ def main():
         target_dir = os.path.sep.join([os.path.expanduser('~'), '.toolsforai', 'RuntimeSDK'])
 
     try:
-        _thread.start_new_thread(install_pkg.install_cntk, (target_dir,))
-    except:
-        logger.error("Fail to startup install_cntk thread!")
-
-    pkg_info = utils.rd_config()
-    install_pkg.pip_software_install(pkg_info, args.options, args.user, args.verbose)
-    utils.delete_env("AITOOLS_CNTK_ROOT")
-    utils.fix_directory_ownership()
-    install_res = "/".join(SysInfo.fail_install)
-    logger.info("Fail to install {0}. Please try to run installer script again!".format(install_res))
+        pkg_info = utils.rd_config()
+        groups = pkg_info.select_groups(args.only, args.exclude)
+    except pkg_config.ConfigError as e:
+        logger.error("Invalid config: {0}".format(e))
+        if args.summary:
+            write_summary(args.summary, EXIT_FAILURE, start)
+        return EXIT_FAILURE
+
+    if args.max_host_connections:
+        import http_pool
+        try:
+            http_pool.configure(*http_pool.parse_host_limits(args.max_host_connections))
+        except ValueError as e:
+            logger.error("Invalid --max-host-connections: {0}".format(e))
+            if args.summary:
+                write_summary(args.summary, EXIT_FAILURE, start)
+            return EXIT_FAILURE
+    cache.configure(args.cache_dir, not args.no_cache)
+    install_pkg.configure_mirror(args.base_url)
+    if args.command == "bundle" or args.from_bundle:
+        import bundle
+    if args.command == "bundle":
+        if not bundle.build_bundle(pkg_info, args.output, args.target_os, args.target_python, args.target_gpu, args.target_cuda,
+                                   groups):
+            return EXIT_FAILURE
+        return EXIT_SUCCESS
+
+    if args.plan:
+        install_pkg.print_plan(install_pkg.pip_plan(pkg_info, install_pkg._pip_options(args.options, args.user, args.verbose), groups))
+        return EXIT_SUCCESS
+
+    cntk_archive = None
+    if args.from_bundle:
+        bundle_dir, manifest = bundle.open_bundle(args.from_bundle)
+        cntk_archive = bundle.bundle_cntk_archive(bundle_dir, manifest)
+    cntk_task = None
+    # CNTK(BrainScript) comes with the cntk group.
+    if "cntk" in groups and not install_pkg.cntk_supported():
+        logger.warning("CNTK(BrainScript) is not supported on your OS, we recommend 64-bit Windows-10 OS or 64-bit Linux OS.")
+    elif "cntk" in groups:
+        cntk_task = scheduler.BackgroundTask(
+            "install_cntk", lambda cancel_event: install_pkg.install_cntk(target_dir, True, cntk_archive, cancel_event,
+                                                           pkg_info.digests))
+
+    if args.from_bundle:
+        bundle.pip_bundle_install(bundle_dir, manifest, args.options, args.user, args.verbose)
+    elif args.targets:
+        targets.install_targets(args.targets.split(","), pkg_info, args.options, args.user, args.verbose, args.jobs,
+                                args.batch, groups)
+    else:
+        install_pkg.pip_software_install(pkg_info, args.options, args.user, args.verbose, args.jobs, args.batch, groups)
+    if cntk_task is None:
+        if "cntk" not in groups:
+            logger.info("CNTK(BrainScript) is not selected, skip installing it.")
+    elif not cntk_task.join(args.cntk_timeout):
+        # install_cntk records an installed or already present RuntimeSDK itself.
+        SysInfo.fail_install.append(install_pkg.CNTK_NAME)
+        install_pkg.install_results[install_pkg.CNTK_NAME] = {"version": "", "status": install_pkg.RESULT_FAILED}
+    with locks.named_lock("env"):
+        utils.delete_env("AITOOLS_CNTK_ROOT")
+        utils.fix_directory_ownership()
+    if SysInfo.fail_install:
+        install_res = "/".join(SysInfo.fail_install)
+        logger.info("Fail to install {0}. Please try to run installer script again!".format(install_res))
+        exit_code = EXIT_PARTIAL_INSTALL
+    else:
+        logger.info("Install all packages successfully!")
+        exit_code = EXIT_SUCCESS
     logger.info('Setup finishes.')
-    input('Press enter to exit.')
+    if args.summary:
+        write_summary(args.summary, exit_code, start)
+    if not args.non_interactive and sys.stdin.isatty():
+        input('Press enter to exit.')
+    return exit_code
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,316 @@
+#coding=utf-8
+from init import TOOLSFORAI_OS_LINUX, TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_MACOS
+from init import logger
+
+import collections
+import os
+import re
+import sys
+
+# Keys of a selector mapping in config.yaml, e.g. name: {gpu: tensorflow-gpu, cpu: tensorflow}.
+SELECTOR_OS_KEYS = (TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_LINUX, TOOLSFORAI_OS_MACOS)
+SELECTOR_DEVICE_KEYS = ("gpu", "cpu")
+SELECTOR_CUDA_KEYS = ("cuda80", "cuda90", "other")
+SELECTOR_KEYS = frozenset(SELECTOR_OS_KEYS + SELECTOR_DEVICE_KEYS + SELECTOR_CUDA_KEYS)
+
+# Fields of a package entry, see the header of config.yaml.
+PACKAGE_FIELDS = ("name", "version", "source", "skip", "requires", "if_installed", "hint", "stop_on_failure")
+# Fields with gpu/cpu/cuda/os selectors, and the ones of them that are templates, see Config.resolve.
+RESOLVED_FIELDS = PACKAGE_FIELDS[:-1]
+TEMPLATE_FIELDS = ("source", "skip", "hint")
+# Platform tag filled into {arch} of wheel URL templates.
+WHEEL_ARCH = {TOOLSFORAI_OS_WIN: "win_amd64", TOOLSFORAI_OS_LINUX: "linux_x86_64", TOOLSFORAI_OS_MACOS: "macosx_10_9_x86_64"}
+IF_INSTALLED_POLICIES = ("keep", "upgrade")
+REQUIRED_TOOLS = ("git",)
+
+CONFIG_CACHE_VERSION = 4
+
+
+class ConfigError(ValueError):
+    pass
+
+
+def _check_selector(node, where):
+    # A selector is a scalar leaf (None, or a string/number coerced to string) or a mapping of selector keys.
+    if node is None:
+        return None
+    if isinstance(node, (str, int, float)) and not isinstance(node, bool):
+        return str(node)
+    if isinstance(node, dict):
+        unknown = [key for key in node if key not in SELECTOR_KEYS]
+        if unknown:
+            raise ConfigError("{0}: unknown selector key(s) {1}, expected some of {2}".format(
+                where, ", ".join(map(str, unknown)), ", ".join(sorted(SELECTOR_KEYS))))
+        return dict((key, _check_selector(value, "{0}.{1}".format(where, key))) for key, value in node.items())
+    raise ConfigError("{0}: expected a string or a selector mapping, got {1!r}".format(where, node))
+
+
+def _select(node, os_name, gpu, cuda):
+    # Walk a selector down to its leaf for one target, None when the target is not covered.
+    while isinstance(node, dict):
+        cuda_key = {"8.0": "cuda80", "9.0": "cuda90"}.get(cuda)
+        if any(key in node for key in SELECTOR_OS_KEYS):
+            node = node.get(os_name)
+        elif gpu and cuda_key in node:
+            node = node[cuda_key]
+        elif gpu and "gpu" in node:
+            node = node["gpu"]
+        elif not gpu and "cpu" in node:
+            node = node["cpu"]
+        elif gpu and "other" not in node and "cuda90" in node:
+            # An unknown CUDA version (e.g. on macOS) gets the cuda90 packages, as before config.yaml had selectors.
+            node = node["cuda90"]
+        else:
+            node = node.get("other")
+    return node
+
+
+def _leaves(node):
+    if isinstance(node, dict):
+        return [leaf for value in node.values() for leaf in _leaves(value)]
+    return [node] if node else []
+
+
+class PackageConfig(object):
+    __slots__ = PACKAGE_FIELDS + ("group", "key")
+
+    def __init__(self, group, key, **fields):
+        self.group = group
+        self.key = key
+        for field in PACKAGE_FIELDS:
+            setattr(self, field, fields.get(field))
+
+    def variants(self):
+        # All names this package can resolve to, e.g. tensorflow and tensorflow-gpu.
+        return _leaves(self.name)
+
+    def select(self, field, os_name, gpu, cuda):
+        return _select(getattr(self, field), os_name, gpu, cuda)
+
+
+class GroupConfig(object):
+    __slots__ = ("name", "depends", "packages")
+
+    def __init__(self, name, depends, packages):
+        self.name = name
+        self.depends = depends
+        self.packages = packages
+
+
+def _check_package(group, key, entry):
+    where = "/".join(filter(None, (group, key)))
+    if not isinstance(entry, dict) or "name" not in entry:
+        raise ConfigError("{0}: expected a package with 'name' and 'version'".format(where))
+    unknown = [field for field in entry if field not in PACKAGE_FIELDS]
+    if unknown:
+        raise ConfigError("{0}: unknown field(s) {1}".format(where, ", ".join(map(str, unknown))))
+    fields = dict((field, _check_selector(value, "{0}.{1}".format(where, field)))
+                  for field, value in entry.items() if field != "stop_on_failure")
+    for field, allowed in (("if_installed", IF_INSTALLED_POLICIES), ("requires", REQUIRED_TOOLS)):
+        invalid = [leaf for leaf in _leaves(fields.get(field)) if leaf not in allowed]
+        if invalid:
+            raise ConfigError("{0}.{1}: invalid value(s) {2}, expected some of {3}".format(
+                where, field, ", ".join(invalid), ", ".join(allowed)))
+    stop_on_failure = entry.get("stop_on_failure", False)
+    if not isinstance(stop_on_failure, bool):
+        raise ConfigError("{0}.stop_on_failure: expected true or false".format(where))
+    fields["stop_on_failure"] = stop_on_failure
+    return PackageConfig(group, key, **fields)
+
+
+def _check_digests(digests):
+    # {file name: sha256}, digests are compared in lower case.
+    if not isinstance(digests, dict):
+        raise ConfigError("digests: expected a mapping of file names to sha256 digests")
+    checked = {}
+    for file_name, digest in digests.items():
+        if not isinstance(digest, str) or not re.match(r"^[0-9a-fA-F]{64}$", digest):
+            raise ConfigError("digests.{0}: expected a sha256 digest of 64 hex digits".format(file_name))
+        checked[str(file_name)] = digest.lower()
+    return checked
+
+
+def _dist_file(file_name):
+    # (canonical project, version) of a wheel or sdist file name, or None.
+    if file_name.endswith(".whl"):
+        parts = file_name.split("-")
+        return (re.sub(r"[-_.]+", "-", parts[0]).lower(), parts[1]) if len(parts) >= 5 else None
+    for extension in (".tar.gz", ".zip"):
+        if file_name.endswith(extension):
+            project, _, version = file_name[:-len(extension)].rpartition("-")
+            return (re.sub(r"[-_.]+", "-", project).lower(), version) if project else None
+    return None
+
+
+def _split_names(names):
+    # "tensorflow, pytorch" or ["tensorflow", "pytorch"] to a list of names.
+    if isinstance(names, str):
+        names = names.split(",")
+    return [name.strip() for name in names or [] if name and name.strip()]
+
+
+class Config(object):
+    __slots__ = ("groups", "profiles", "source", "digests")
+
+    def __init__(self, groups, profiles=None, source=None, digests=None):
+        self.groups = groups
+        self.profiles = profiles or {}
+        self.source = source
+        self.digests = digests or {}
+
+    @classmethod
+    def from_dict(cls, data, source=None):
+        if not isinstance(data, dict):
+            raise ConfigError("{0}: expected a mapping of package groups".format(source))
+        data = collections.OrderedDict(data)
+        profiles = data.pop("profiles", None) or {}
+        if not isinstance(profiles, dict):
+            raise ConfigError("profiles: expected a mapping of profile names to lists of groups")
+        digests = _check_digests(data.pop("digests", None) or {})
+        groups = []
+        for group, entries in data.items():
+            if not isinstance(entries, dict):
+                raise ConfigError("{0}: expected a mapping".format(group))
+            entries = collections.OrderedDict(entries)
+            depends = entries.pop("depends", None) or []
+            if not isinstance(depends, list):
+                raise ConfigError("{0}.depends: expected a list of groups".format(group))
+            for dep in depends:
+                # Groups run in file order, so a dependency must come first.
+                if dep not in [other.name for other in groups]:
+                    raise ConfigError("{0}: depends on {1}, which must be declared before it".format(group, dep))
+            # A group is either one package with name/version, or a mapping of such packages.
+            items = [(None, entries)] if "name" in entries else list(entries.items())
+            groups.append(GroupConfig(group, tuple(depends), [_check_package(group, key, entry) for key, entry in items]))
+        names = [group.name for group in groups]
+        for profile, members in profiles.items():
+            if profile in names:
+                raise ConfigError("profiles.{0}: a profile can not have the name of a group".format(profile))
+            if not isinstance(members, list) or any(member not in names for member in members):
+                raise ConfigError("profiles.{0}: expected a list of groups, some of {1}".format(profile, ", ".join(names)))
+        return cls(groups, dict((profile, tuple(members)) for profile, members in profiles.items()), source, digests)
+
+    def digest(self, file_name):
+        return self.digests.get(file_name)
+
+    def dist_digests(self, name, version):
+        # Digests of every file of the distribution name == version, e.g. its wheels for each platform.
+        dist = (re.sub(r"[-_.]+", "-", name).lower(), version)
+        return tuple(sorted(digest for file_name, digest in self.digests.items() if _dist_file(file_name) == dist))
+
+    def group(self, name):
+        try:
+            return next(group for group in self.groups if group.name == name)
+        except StopIteration:
+            raise ConfigError("config.yaml has no group {0}".format(name))
+
+    def _expand(self, names, option):
+        # Group and profile names are matched case-insensitively, e.g. keras for Keras.
+        groups = dict((group.name.lower(), [group.name]) for group in self.groups)
+        groups.update((profile.lower(), list(members)) for profile, members in self.profiles.items())
+        selected = set()
+        for name in _split_names(names):
+            if name.lower() not in groups:
+                raise ConfigError("{0}: unknown group or profile {1}, expected some of {2}".format(
+                    option, name, ", ".join([group.name for group in self.groups] + sorted(self.profiles))))
+            selected.update(groups[name.lower()])
+        return selected
+
+    def select_groups(self, only=None, exclude=None):
+        # Names of the groups to install, in install order: the `only` groups and profiles (every group when
+        # empty) with the groups they depend on, minus the `exclude` ones and the groups depending on them.
+        selected = self._expand(only, "--only") if _split_names(only) else set(group.name for group in self.groups)
+        for group in reversed(self.groups):
+            # Dependencies are declared first, so walking backwards closes over them in one pass.
+            if group.name in selected:
+                selected.update(group.depends)
+        excluded = self._expand(exclude, "--exclude")
+        for group in self.groups:
+            dep = next((dep for dep in group.depends if dep in excluded), None)
+            if dep and group.name in selected and group.name not in excluded:
+                logger.warning("Exclude {0} because it depends on {1}.".format(group.name, dep))
+                excluded.add(group.name)
+        return [group.name for group in self.groups if group.name in selected and group.name not in excluded]
+
+    def packages(self):
+        return [package for group in self.groups for package in group.packages]
+
+    def resolve(self, os_name, gpu, cuda, python, groups=None):
+        # [(group, package, {field: selected value})] for one target, in install order, without the packages it
+        # does not cover. {name}, {version}, {python} and {arch} in source, skip and hint are filled in, so that
+        # source is the final wheel URL for the interpreter. groups limits it to some group names, see
+        # select_groups.
+        resolved = []
+        for group in self.groups:
+            if groups is not None and group.name not in groups:
+                continue
+            for package in group.packages:
+                fields = dict((field, package.select(field, os_name, gpu, cuda)) for field in RESOLVED_FIELDS)
+                if not fields["name"]:
+                    continue
+                values = {"name": fields["name"], "version": fields["version"] or "", "python": python,
+                          "arch": WHEEL_ARCH.get(os_name, "")}
+                for field in TEMPLATE_FIELDS:
+                    if fields[field]:
+                        fields[field] = fields[field].format(**values)
+                resolved.append((group, package, fields))
+        return resolved
+
+    def variant_groups(self):
+        return [set(package.variants()) for package in self.packages() if isinstance(package.name, dict)]
+
+
+def _yaml_loader():
+    import yaml
+    # The libyaml based loader is several times faster when PyYAML is built with it.
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+    if sys.version_info >= (3, 7):
+        return loader
+
+    # Group order is install order, keep it where dicts are not ordered yet.
+    class OrderedLoader(loader):
+        pass
+    OrderedLoader.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
+                                  lambda loader, node: collections.OrderedDict(loader.construct_pairs(node)))
+    return OrderedLoader
+
+
+def _cache_path():
+    return os.path.sep.join([os.path.expanduser('~'), '.toolsforai', 'config_cache.pickle'])
+
+
+def load_config(config_path, use_cache=True):
+    # Parsed and validated configs are pickled, keyed by the YAML path, mtime and content hash.
+    import hashlib
+    import pickle
+    with open(config_path, 'rb') as fin:
+        content = fin.read()
+    key = (CONFIG_CACHE_VERSION, os.path.realpath(config_path), os.path.getmtime(config_path),
+           hashlib.sha256(content).hexdigest())
+    cache_path = _cache_path()
+    if use_cache:
+        try:
+            with open(cache_path, 'rb') as fin:
+                cached_key, config = pickle.load(fin)
+            if cached_key == key:
+                logger.debug("Use cached config {0}.".format(cache_path))
+                return config
+        except Exception:
+            pass
+
+    import yaml
+    try:
+        data = yaml.load(content.decode('utf-8'), Loader=_yaml_loader())
+    except yaml.YAMLError as e:
+        raise ConfigError("{0}: {1}".format(config_path, e))
+    config = Config.from_dict(data, config_path)
+    if use_cache:
+        try:
+            if not os.path.isdir(os.path.dirname(cache_path)):
+                os.makedirs(os.path.dirname(cache_path))
+            with open(cache_path + ".tmp", 'wb') as fout:
+                pickle.dump((key, config), fout, pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_path + ".tmp", cache_path)
+        except Exception as e:
+            logger.debug("Fail to cache config {0}, unexpected error: {1}".format(cache_path, e))
+    return config
@@ -0,0 +1,122 @@
+#coding=utf-8
+from init import logger
+
+import asyncio
+import collections
+import locale
+import os
+import subprocess
+import sys
+import threading
+
+# asyncio.StreamReader buffer per pipe, a longer line is dropped instead of growing the buffer.
+RUN_CMD_LINE_LIMIT = 64 * 1024
+# Lines of each pipe kept for the caller, older lines are only in the debug log.
+RUN_CMD_KEEP_LINES = 10000
+
+
+class CommandResult(object):
+    __slots__ = ("returncode", "stdout", "stderr", "timed_out")
+
+    def __init__(self, returncode, stdout, stderr, timed_out=False):
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+
+
+def _log_line(name, label, text):
+    if text.strip():
+        logger.debug("[{0} {1}] {2}".format(name, label, text))
+
+
+async def _pump(stream, lines, name, label):
+    encoding = locale.getpreferredencoding(False)
+    while True:
+        try:
+            line = await stream.readline()
+        except ValueError:
+            # Longer than RUN_CMD_LINE_LIMIT, the StreamReader has discarded it.
+            _log_line(name, label, "<line longer than {0} bytes dropped>".format(RUN_CMD_LINE_LIMIT))
+            continue
+        if not line:
+            return
+        text = line.decode(encoding, errors="replace").rstrip("\r\n")
+        _log_line(name, label, text)
+        lines.append(text)
+
+
+async def run_command(cmd, args=(), timeout=None, name=None, merge_stderr=False, keep_lines=RUN_CMD_KEEP_LINES):
+    # Runs cmd streaming stdout and stderr into the debug log as lines arrive. Only the last keep_lines lines of
+    # each pipe are returned, with merge_stderr both are in stdout. The process is killed after timeout seconds.
+    name = name or os.path.basename(cmd)
+    proc = await asyncio.create_subprocess_exec(
+        cmd, *args, stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT if merge_stderr else asyncio.subprocess.PIPE, limit=RUN_CMD_LINE_LIMIT)
+    stdout = collections.deque(maxlen=keep_lines)
+    stderr = collections.deque(maxlen=keep_lines)
+    pumps = [_pump(proc.stdout, stdout, name, "stdout")]
+    if not merge_stderr:
+        pumps.append(_pump(proc.stderr, stderr, name, "stderr"))
+    timed_out = False
+    try:
+        await asyncio.wait_for(asyncio.gather(proc.wait(), *pumps), timeout)
+    except asyncio.TimeoutError:
+        timed_out = True
+        logger.warning("{0} does not finish in {1} seconds, kill it.".format(name, timeout))
+        try:
+            proc.kill()
+        except ProcessLookupError:
+            pass
+    except BaseException:
+        # Cancelled, e.g. by a timeout of the caller, do not leave the child running.
+        if proc.returncode is None:
+            proc.kill()
+        raise
+    returncode = await proc.wait()
+    return CommandResult(returncode, list(stdout), list(stderr), timed_out)
+
+
+def _run_blocking(cmd, args, timeout, merge_stderr, keep_lines):
+    # Without asyncio subprocess support in worker threads (POSIX before Python 3.8), output is logged on exit.
+    name = os.path.basename(cmd)
+    try:
+        p = subprocess.run([cmd, *args], stdout=subprocess.PIPE, stderr=subprocess.STDOUT if merge_stderr else subprocess.PIPE,
+                           universal_newlines=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        logger.warning("{0} does not finish in {1} seconds, kill it.".format(name, timeout))
+        return CommandResult(-9, [], [], True)
+    result = []
+    for label, output in (("stdout", p.stdout), ("stderr", p.stderr or "")):
+        lines = output.splitlines()[-keep_lines:]
+        for line in lines:
+            _log_line(name, label, line)
+        result.append(lines)
+    return CommandResult(p.returncode, result[0], result[1])
+
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def _event_loop():
+    # One event loop in a daemon thread supervises the child processes of every thread.
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.ProactorEventLoop() if sys.platform == "win32" else asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="cmd-runner", daemon=True).start()
+            _loop = loop
+        return _loop
+
+
+def supported():
+    return sys.platform == "win32" or sys.version_info >= (3, 8)
+
+
+def run(cmd, args=(), timeout=None, name=None, merge_stderr=False, keep_lines=RUN_CMD_KEEP_LINES):
+    # Blocking call of run_command, safe from any thread. Raises OSError when cmd can not be started.
+    if not supported():
+        return _run_blocking(cmd, list(args), timeout, merge_stderr, keep_lines)
+    coro = run_command(cmd, list(args), timeout, name, merge_stderr, keep_lines)
+    return asyncio.run_coroutine_threadsafe(coro, _event_loop()).result()
@@ -0,0 +1,126 @@
+#coding=utf-8
+from init import logger
+import tracing
+
+import concurrent.futures
+import threading
+
+GROUP_STATUS_SUCCESS = "success"
+GROUP_STATUS_FAIL = "fail"
+GROUP_STATUS_SKIP = "skip"
+
+
+class InstallGroup(object):
+    # A group's func returning False (not None) marks it as failed, and every group depending on it is skipped.
+    def __init__(self, name, func, deps=()):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+
+
+def _check_groups(groups):
+    names = [group.name for group in groups]
+    seen = set()
+    for group in groups:
+        if group.name in seen:
+            raise ValueError("Duplicate install group: {0}".format(group.name))
+        for dep in group.deps:
+            if dep not in names:
+                raise ValueError("Install group {0} depends on unknown group {1}".format(group.name, dep))
+            if dep not in seen:
+                # Declared order must already be a topological order, so that serial runs keep the legacy order.
+                raise ValueError("Install group {0} must be declared after its dependency {1}".format(group.name, dep))
+        seen.add(group.name)
+
+
+def _run_group(group):
+    try:
+        res = group.func()
+    except Exception as e:
+        logger.error("Fail to install {0}, unexpected error: {1}".format(group.name, e))
+        res = False
+    return (GROUP_STATUS_FAIL if res is False else GROUP_STATUS_SUCCESS), res
+
+
+def run_groups(groups, jobs=1):
+    # Run install groups respecting their dependencies, with at most `jobs` groups running at the same time.
+    # Returns {name: (status, result)}; iterate `groups` to consume it in a deterministic order.
+    _check_groups(groups)
+    results = {}
+
+    def blocked_by(group):
+        return next((dep for dep in group.deps if results[dep][0] != GROUP_STATUS_SUCCESS), None)
+
+    if jobs is None or jobs <= 1:
+        for group in groups:
+            dep = blocked_by(group)
+            if dep:
+                logger.warning("Skip installing {0} because {1} is not installed.".format(group.name, dep))
+                results[group.name] = (GROUP_STATUS_SKIP, None)
+                continue
+            results[group.name] = _run_group(group)
+        return results
+
+    pending = list(groups)
+    running = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            for group in list(pending):
+                if any(dep not in results for dep in group.deps):
+                    continue
+                pending.remove(group)
+                dep = blocked_by(group)
+                if dep:
+                    logger.warning("Skip installing {0} because {1} is not installed.".format(group.name, dep))
+                    results[group.name] = (GROUP_STATUS_SKIP, None)
+                    continue
+                logger.debug("Schedule install group: {0}".format(group.name))
+                running[executor.submit(_run_group, group)] = group
+            if not running:
+                # Skipping groups may have unblocked others, re-scan before waiting.
+                continue
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                results[running.pop(future).name] = future.result()
+    return results
+
+
+class BackgroundTask(object):
+    # Runs func(cancel_event) in a daemon thread behind a Future, so that the task can be joined with a timeout
+    # and a timed-out task does not keep the installer from exiting. Cancellation is cooperative: func is
+    # expected to check cancel_event between its steps.
+    def __init__(self, name, func):
+        self.name = name
+        self.cancel_event = threading.Event()
+        self.future = concurrent.futures.Future()
+        self.thread = threading.Thread(target=self._run, args=(func,), name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self, func):
+        if not self.future.set_running_or_notify_cancel():
+            return
+        try:
+            with tracing.span(self.name, "task"):
+                self.future.set_result(func(self.cancel_event))
+        except BaseException as e:
+            self.future.set_exception(e)
+
+    def cancel(self):
+        self.cancel_event.set()
+        self.future.cancel()
+
+    def join(self, timeout=None):
+        # Returns the task result, or False when it raised, timed out or was cancelled.
+        try:
+            return self.future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            logger.error("{0} does not finish in {1} seconds, cancel it.".format(self.name, timeout))
+            self.cancel()
+        except concurrent.futures.CancelledError:
+            logger.error("{0} is cancelled.".format(self.name))
+        except KeyboardInterrupt:
+            self.cancel()
+            raise
+        except Exception as e:
+            logger.error("{0} failed, unexpected error: {1}".format(self.name, e))
+        return False
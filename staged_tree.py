@@ -0,0 +1,223 @@
+#coding=utf-8
+from init import logger
+import tracing
+import utils
+
+import hashlib
+import json
+import os
+import shutil
+import sys
+import threading
+
+# Path, size and sha256 of every file of an installed tree, written into its root.
+MANIFEST_NAME = ".toolsforai-manifest.json"
+MANIFEST_VERSION = 1
+# A member of the size of its installed file is buffered up to this size in memory to compare digests before
+# it is written, larger members spill to a temporary file.
+TREE_SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
+
+def read_manifest(root_dir):
+    # {relative path: [size, sha256]} of the tree installed in root_dir, empty without a readable manifest.
+    try:
+        with open(os.path.join(root_dir, MANIFEST_NAME)) as fin:
+            manifest = json.load(fin)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest["files"]
+    except (IOError, OSError, ValueError, KeyError, AttributeError):
+        pass
+    return {}
+
+
+class StagedTree(object):
+    # Updates target_dir/root from an archive whose members are under root/. The new tree is built in a staging
+    # directory next to it: members with the size and sha256 of the installed file in its manifest are hard-linked
+    # from it, only changed and new members are written. commit swaps the staged tree in, so members that are not
+    # in the archive any more go away with the old tree. An interrupted update leaves the installed tree as it was,
+    # or its backup when it stops between the two renames of commit, which the next update moves back.
+    def __init__(self, target_dir, root):
+        self.target_dir = target_dir
+        self.root = root
+        self.root_dir = os.path.join(target_dir, root)
+        self.staging_dir = os.path.join(target_dir, ".{0}.staging".format(root))
+        self.backup_dir = os.path.join(target_dir, ".{0}.old".format(root))
+        self.lock = threading.Lock()
+        self.manifest = {}
+        self.files = {}
+        self.stats = {"written": 0, "written_bytes": 0, "linked": 0, "linked_bytes": 0}
+
+    def recover(self):
+        if os.path.isdir(self.backup_dir):
+            if os.path.isdir(self.root_dir):
+                shutil.rmtree(self.backup_dir)
+            else:
+                logger.warning("Restore {0} of an interrupted update.".format(self.root_dir))
+                os.rename(self.backup_dir, self.root_dir)
+        if os.path.isdir(self.staging_dir):
+            shutil.rmtree(self.staging_dir)
+
+    def begin(self):
+        # Starts over with an empty staging directory, also when an earlier attempt left one.
+        self.recover()
+        self.manifest = read_manifest(self.root_dir)
+        self.files = {}
+        for key in self.stats:
+            self.stats[key] = 0
+        os.makedirs(self.staging_dir)
+
+    def _member_path(self, name):
+        # (staged path, path relative to the root or None outside of it) of an archive member.
+        path = utils._zip_member_path(name, self.staging_dir)
+        if not path:
+            return None, None
+        relative = os.path.relpath(path, os.path.join(self.staging_dir, self.root))
+        if relative == os.curdir or relative.startswith(os.pardir):
+            return path, None
+        return path, relative.replace(os.sep, "/")
+
+    def _link(self, installed_path, path):
+        try:
+            os.link(installed_path, path)
+        except (OSError, AttributeError):
+            return False
+        return True
+
+    def add_file(self, name, fin, size, mode=None):
+        path, relative = self._member_path(name)
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        digest = hashlib.sha256()
+        installed = self.manifest.get(relative) if relative else None
+        installed_path = os.path.join(self.root_dir, *relative.split("/")) if installed else None
+        if installed and installed[0] == size and os.path.isfile(installed_path) \
+                and os.path.getsize(installed_path) == size:
+            import tempfile
+            with tempfile.SpooledTemporaryFile(max_size=TREE_SPOOL_MAX_SIZE, dir=self.staging_dir) as spool:
+                for chunk in iter(lambda: fin.read(utils.DOWNLOAD_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    spool.write(chunk)
+                if digest.hexdigest() == installed[1] and self._link(installed_path, path):
+                    self._record(relative, size, installed[1], "linked")
+                    return
+                spool.seek(0)
+                with open(path, 'wb') as fout:
+                    shutil.copyfileobj(spool, fout, utils.DOWNLOAD_CHUNK_SIZE)
+        else:
+            with open(path, 'wb') as fout:
+                for chunk in iter(lambda: fin.read(utils.DOWNLOAD_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    fout.write(chunk)
+        if mode and sys.platform != "win32":
+            os.chmod(path, mode)
+        self._record(relative, size, digest.hexdigest(), "written")
+
+    def _record(self, relative, size, sha256, kind):
+        with self.lock:
+            if relative:
+                self.files[relative] = [size, sha256]
+            self.stats[kind] += 1
+            self.stats[kind + "_bytes"] += size
+
+    def add_tar(self, tar):
+        # Members of an open tarfile, in order, which also works on a stream ('r|gz').
+        for info in tar:
+            path, _ = self._member_path(info.name)
+            if not path:
+                continue
+            if info.isdir():
+                os.makedirs(path, exist_ok=True)
+            elif info.isfile():
+                self.add_file(info.name, tar.extractfile(info), info.size, info.mode)
+            elif info.issym() or info.islnk():
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if os.path.lexists(path):
+                    os.remove(path)
+                if info.issym():
+                    os.symlink(info.linkname, path)
+                else:
+                    target, _ = self._member_path(info.linkname)
+                    if target:
+                        os.link(target, path)
+
+    def add_zip(self, zip_file, infos=None):
+        for info in zip_file.infolist() if infos is None else infos:
+            path, _ = self._member_path(info.filename)
+            if not path:
+                continue
+            if info.filename.endswith('/'):
+                os.makedirs(path, exist_ok=True)
+            else:
+                with zip_file.open(info) as fin:
+                    self.add_file(info.filename, fin, info.file_size, (info.external_attr >> 16) & 0o7777)
+
+    def add_archive(self, file_path, workers=None):
+        # A downloaded .zip or .tar.gz. The members of a zip are staged by several threads, like _unzip_file.
+        if file_path.lower().endswith(".zip"):
+            import concurrent.futures
+            import zipfile
+            with zipfile.ZipFile(file_path) as zip_file:
+                infos = zip_file.infolist()
+            partitions = utils._partition_zip_members(infos, workers or os.cpu_count() or 1)
+
+            def add_partition(infos):
+                with zipfile.ZipFile(file_path) as zip_file:
+                    self.add_zip(zip_file, infos)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(partitions))) as executor:
+                for future in [executor.submit(add_partition, partition) for partition in partitions]:
+                    future.result()
+        else:
+            import tarfile
+            with tarfile.open(file_path) as tar:
+                self.add_tar(tar)
+
+    def extract(self, archive, target_dir=None):
+        # The extract callback of utils._download_extract, restarting from scratch on every attempt.
+        self.begin()
+        if hasattr(archive, "infolist"):
+            self.add_zip(archive)
+        else:
+            self.add_tar(archive)
+
+    def commit(self):
+        # Writes the manifest into the staged root and swaps it in. Other top-level members of the archive
+        # replace theirs one by one.
+        staged_root = os.path.join(self.staging_dir, self.root)
+        if not self.files:
+            raise IOError("The archive has no files under {0}/.".format(self.root))
+        with open(os.path.join(staged_root, MANIFEST_NAME), 'w') as fout:
+            json.dump({"version": MANIFEST_VERSION, "files": self.files}, fout, sort_keys=True)
+        for name in os.listdir(self.staging_dir):
+            if name == self.root:
+                continue
+            path = os.path.join(self.target_dir, name)
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path)
+            os.replace(os.path.join(self.staging_dir, name), path)
+        if os.path.isdir(self.root_dir):
+            os.rename(self.root_dir, self.backup_dir)
+        os.rename(staged_root, self.root_dir)
+        shutil.rmtree(self.backup_dir, ignore_errors=True)
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+        logger.info("Updated {0}: {1} files written ({2:.1f} MB), {3} unchanged files kept ({4:.1f} MB).".format(
+            self.root_dir, self.stats["written"], self.stats["written_bytes"] / 1024 / 1024, self.stats["linked"],
+            self.stats["linked_bytes"] / 1024 / 1024))
+
+    def abort(self):
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+
+@tracing.traced("extract")
+def update_from_archive(tree, file_path):
+    # Stages a downloaded archive and swaps it in, returns False on failure with the installed tree untouched.
+    logger.info("Extracting {0} to {1} ...".format(file_path, tree.root_dir))
+    try:
+        tree.begin()
+        tree.add_archive(file_path)
+        tree.commit()
+        return True
+    except:
+        logger.error("Fail to extract. Error: {0}".format(sys.exc_info()))
+        tree.abort()
+        return False
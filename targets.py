@@ -0,0 +1,172 @@
+#coding=utf-8
+from init import SysInfo
+from init import logger
+import cache
+import install_pkg
+import tracing
+import utils
+
+import json
+import logging
+import os
+import shutil
+import sys
+
+# SysInfo fields a target process inherits from this machine's detection, python is probed per target.
+TARGET_SYSINFO_FIELDS = ["os", "gpu", "cuda", "cudnn", "cuda80", "git", "mpi"]
+
+# Per target results of the last install_targets, by target path, for the run summary.
+target_results = {}
+
+_PROBE_CODE = ("import json, site, struct, sys; print(json.dumps({'version': list(sys.version_info[:2]), "
+               "'bits': struct.calcsize('P') * 8, 'path': sys.path, 'user_site': site.getusersitepackages()}))")
+
+
+class Target(object):
+    # One interpreter to install into. python is its SysInfo.python (e.g. "36") and paths the sys.path of it,
+    # for the installed state.
+    __slots__ = ("path", "executable", "python", "paths")
+
+    def __init__(self, path, executable, python, paths):
+        self.path = path
+        self.executable = executable
+        self.python = python
+        self.paths = tuple(paths)
+
+
+def _target_executable(path):
+    # A venv or Python installation directory, or an interpreter.
+    if not os.path.isdir(path):
+        return path
+    for candidate in (os.path.join(path, "Scripts", "python.exe"), os.path.join(path, "python.exe"),
+                      os.path.join(path, "bin", "python3"), os.path.join(path, "bin", "python")):
+        if os.path.isfile(candidate):
+            return candidate
+    return None
+
+
+def probe_target(path):
+    # Returns the Target of an interpreter or venv path, or None when it is not a 64-bit Python 3.5+.
+    executable = _target_executable(os.path.expanduser(path))
+    status, stdout = (False, "") if executable is None else utils._run_cmd(executable, ["-c", _PROBE_CODE], True)
+    if not status:
+        logger.error("Fail to find a Python interpreter in {0}.".format(path))
+        return None
+    probe = json.loads(stdout.strip().splitlines()[-1])
+    version = ".".join(map(str, probe["version"]))
+    if not utils._version_compare("3.5", version) or probe["bits"] != 64:
+        logger.error("64-bit Python 3.5 or higher is required, {0} is {1}-bit Python {2}.".format(path, probe["bits"], version))
+        return None
+    logger.info("Target {0}: Python {1}, {2}".format(path, version, executable))
+    return Target(path, executable, "".join(map(str, probe["version"])), probe["path"] + [probe["user_site"]])
+
+
+def _prefetch(plans, jobs):
+    # Downloads every wheel URL of every target plan into the artifact cache once, targets then install from it.
+    import concurrent.futures
+    urls = []
+    digests = {}
+    for plan in plans:
+        for entry in plan:
+            if not entry.source or entry.source in urls or not entry.source.endswith(".whl") \
+                    or not entry.source.startswith(("http://", "https://")):
+                continue
+            if install_pkg._entry_status(entry, True) in (install_pkg.ENTRY_INSTALL, install_pkg.ENTRY_UPGRADE):
+                urls.append(entry.source)
+                digests[entry.source] = entry.sha256
+    if not urls:
+        return
+    logger.info("Downloading {0} wheels shared by the targets ...".format(len(urls)))
+    with tracing.span("prefetch", "download", wheels=len(urls)):
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, min(jobs, len(urls)))) as executor:
+            for url, path in zip(urls, executor.map(cache.fetch, urls, [digests[url] for url in urls])):
+                if not path:
+                    logger.warning("Fail to download {0}, the targets will try again.".format(url))
+
+
+def _install_target(target, sysinfo, pkg_info, options, user, verbose, jobs, batch, groups, cache_dir, base_url):
+    # Runs in a worker process: installs the plan of one target with its own pip and installed state.
+    for handler in logger.handlers:
+        handler.setFormatter(logging.Formatter(fmt='%(asctime)s.%(msecs)03d [%(levelname)s] [%(name)s] '
+                                                   '[{0}] %(message)s'.format(target.path), datefmt='%H:%M:%S'))
+    if verbose:
+        logger.setLevel(logging.DEBUG)
+    for field, value in sysinfo.items():
+        setattr(SysInfo, field, value)
+    SysInfo.python = target.python
+    SysInfo.fail_install = []
+    install_pkg.install_results.clear()
+    install_pkg.python_executable = target.executable
+    utils.installed_index = utils.InstalledIndex(target.paths)
+    cache.configure(cache_dir, cache_dir is not None)
+    install_pkg.configure_mirror(base_url)
+    try:
+        install_pkg.pip_software_install(pkg_info, options, user, verbose, jobs, batch, groups)
+    except Exception as e:
+        logger.error("Fail to install into {0}, unexpected error: {1}".format(target.path, e))
+        SysInfo.fail_install.append("Python {0}".format(target.path))
+    return list(SysInfo.fail_install), dict(install_pkg.install_results)
+
+
+def _process_pool(workers):
+    import concurrent.futures
+    if sys.version_info >= (3, 7):
+        # A fresh interpreter per worker, not a fork of this process and its threads.
+        import multiprocessing
+        return concurrent.futures.ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    return concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+
+
+def install_targets(paths, pkg_info, options, user, verbose, jobs=1, batch=False, groups=None):
+    # Installs the selected groups into every interpreter or venv of paths concurrently, one process per target.
+    # Failures are added to SysInfo.fail_install as "<package> (<target>)", paths that are not a supported Python
+    # as "Python <path>". Returns False when some path is not a supported Python.
+    targets = []
+    for path in paths:
+        target = probe_target(path)
+        if target is None:
+            SysInfo.fail_install.append("Python {0}".format(path))
+        else:
+            targets.append(target)
+    if not targets:
+        return False
+
+    tmp_cache_dir = None
+    if cache.artifact_cache is None:
+        # Without the cache (--no-cache), the shared downloads are kept for this run only.
+        import tempfile
+        tmp_cache_dir = tempfile.mkdtemp(prefix="toolsforai-targets-")
+        cache.configure(tmp_cache_dir)
+    try:
+        python = SysInfo.python
+        plans = []
+        for target in targets:
+            SysInfo.python = target.python
+            plans.append(install_pkg.target_plan(pkg_info, groups))
+        SysInfo.python = python
+        _prefetch(plans, max(jobs, 4))
+
+        sysinfo = dict((field, getattr(SysInfo, field)) for field in TARGET_SYSINFO_FIELDS)
+        cache_dir = cache.artifact_cache.cache_dir if cache.artifact_cache else None
+        logger.info("Begin to install into {0} targets ...".format(len(targets)))
+        with _process_pool(len(targets)) as executor:
+            futures = [executor.submit(_install_target, target, sysinfo, pkg_info, options, user, verbose, jobs, batch,
+                                       groups, cache_dir, install_pkg.mirror_base_url) for target in targets]
+            for target, future in zip(targets, futures):
+                try:
+                    fail_install, results = future.result()
+                except Exception as e:
+                    logger.error("Fail to install into {0}, unexpected error: {1}".format(target.path, e))
+                    fail_install, results = ["Python {0}".format(target.path)], {}
+                target_results[target.path] = {"python": target.python, "executable": target.executable,
+                                               "fail_install": fail_install, "packages": dict(sorted(results.items()))}
+                SysInfo.fail_install.extend("{0} ({1})".format(failure, target.path) for failure in fail_install)
+                if fail_install:
+                    logger.warning("Fail to install {0} into {1}.".format("/".join(fail_install), target.path))
+                else:
+                    logger.info("Install all packages into {0} successfully!".format(target.path))
+    finally:
+        if tmp_cache_dir:
+            cache.configure(enabled=False)
+            shutil.rmtree(tmp_cache_dir, ignore_errors=True)
+    return len(targets) == len(paths)
@@ -0,0 +1,124 @@
+#coding=utf-8
+from init import logger
+
+import contextlib
+import functools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, CPU time and peak RSS are then left out of the report.
+    resource = None
+
+_lock = threading.Lock()
+_events = []
+_start = time.time()
+_start_perf = time.perf_counter()
+# Functions returning counters of a subsystem for the report, by name, see register_stats.
+_stats = {}
+
+
+def _rusage():
+    if resource is None:
+        return None
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in KB on Linux, in bytes on macOS.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {"children_cpu": children.ru_utime + children.ru_stime,
+            "peak_rss": own.ru_maxrss * scale, "children_peak_rss": children.ru_maxrss * scale}
+
+
+@contextlib.contextmanager
+def span(name, category, **args):
+    # Records wall time and resource usage of the block. The yielded dict is added to the event args, so the
+    # block can attach results such as "bytes". Child CPU time is process wide: it includes every child
+    # process that was reaped while the span was open, also those of concurrent spans.
+    args = dict(args)
+    begin = time.perf_counter()
+    usage = _rusage()
+    try:
+        yield args
+    except BaseException as e:
+        args.setdefault("error", repr(e))
+        raise
+    finally:
+        end = time.perf_counter()
+        if usage is not None:
+            after = _rusage()
+            args["children_cpu"] = round(after["children_cpu"] - usage["children_cpu"], 6)
+            args["peak_rss"] = after["peak_rss"]
+            args["children_peak_rss"] = after["children_peak_rss"]
+        event = {"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": threading.get_ident(),
+                 "ts": round((begin - _start_perf) * 1e6), "dur": round((end - begin) * 1e6), "args": args}
+        with _lock:
+            _events.append(event)
+
+
+def traced(category, name=None):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__, category):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def register_stats(name, func):
+    # func() is called when the report is written, its result is added to otherData under name.
+    with _lock:
+        _stats[name] = func
+
+
+def events():
+    with _lock:
+        return list(_events)
+
+
+def summary():
+    totals = {}
+    for event in events():
+        total = totals.setdefault(event["cat"], {"count": 0, "wall": 0.0, "children_cpu": 0.0, "bytes": 0})
+        total["count"] += 1
+        total["wall"] = round(total["wall"] + event["dur"] / 1e6, 6)
+        total["children_cpu"] = round(total["children_cpu"] + event["args"].get("children_cpu", 0.0), 6)
+        total["bytes"] += event["args"].get("bytes", 0)
+    return totals
+
+
+def write_report(path):
+    # Chrome trace event format (chrome://tracing, Perfetto), run metadata and per-category totals in otherData.
+    usage = _rusage() or {}
+    report = {
+        "traceEvents": events(),
+        "displayTimeUnit": "ms",
+        "otherData": {
+            "host": platform.node(),
+            "platform": platform.platform(terse=True),
+            "python": sys.version.split()[0],
+            "start": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(_start)),
+            "wall": round(time.perf_counter() - _start_perf, 6),
+            "peak_rss": usage.get("peak_rss"),
+            "children_peak_rss": usage.get("children_peak_rss"),
+            "summary": summary(),
+        },
+    }
+    with _lock:
+        stats = dict(_stats)
+    for name, func in stats.items():
+        report["otherData"][name] = func()
+    try:
+        with open(path, 'w') as fout:
+            json.dump(report, fout, indent=1)
+        logger.info("Write trace report to {0}.".format(path))
+        return True
+    except Exception as e:
+        logger.error("Fail to write trace report {0}, unexpected error: {1}".format(path, e))
+        return False
@@ -2,21 +2,24 @@
 from init import TOOLSFORAI_OS_LINUX, TOOLSFORAI_OS_WIN, TOOLSFORAI_OS_MACOS
 from init import SysInfo
 from init import logger
+import tracing
 
-import argparse
-import ctypes
 import os
 import platform
 import re
-import subprocess
 import sys
-import yaml
+import threading
+import time
 
 if platform.system() == "Windows":
     import winreg
-    from init import ShellExecuteInfo
+    from init import shell_execute_info
+
+    _VISUALCPP_RUNTIME_NAME = re.compile(
+        r"^Microsoft Visual C\+\+ 201(5|7) x64 (Additional|Minimum) Runtime")
 
 # detect
+@tracing.traced("detect")
 def detect_os():
     os_name = platform.platform(terse=True)
     os_bit = platform.architecture()[0]
@@ -41,23 +44,27 @@ def detect_os():
         return False
     return True
 
-def detect_gpu():
+def _gpu_detector_path():
     gpu_detector_name = 'gpu_detector_' + SysInfo.os
     if (SysInfo.os == TOOLSFORAI_OS_WIN):
         gpu_detector_name = gpu_detector_name + '.exe'
-    gpu_detector_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "tools", gpu_detector_name)
+    return os.path.join(os.path.dirname(os.path.realpath(__file__)), "tools", gpu_detector_name)
 
+@tracing.traced("detect")
+def detect_gpu(probe=None):
+    gpu_detector_path = _gpu_detector_path()
     if not (os.path.isfile(gpu_detector_path)):
         logger.error(
             'Not find GPU detector. Please make sure {0} is in the same directory with the installer script.'.format(
-                gpu_detector_name))
+                os.path.basename(gpu_detector_path)))
         return False
-    SysInfo.gpu, return_stdout = _run_cmd(gpu_detector_path, return_stdout=True)
+    SysInfo.gpu, return_stdout = probe or _run_cmd(gpu_detector_path, return_stdout=True)
     if not SysInfo.gpu:
         return_stdout = 'None'
     logger.info('NVIDIA GPU: {0}'.format(return_stdout))
     return True
 
+@tracing.traced("detect")
 def detect_python_version():
     py_architecture = platform.architecture()[0]
     py_version = ".".join(map(str, sys.version_info[0:2]))
@@ -71,14 +78,16 @@ def detect_python_version():
         return False
     return True
 
-def detect_git():
-    res = _run_cmd("git", ["--version"])
+@tracing.traced("detect")
+def detect_git(probe=None):
+    res = _run_cmd("git", ["--version"]) if probe is None else probe
     SysInfo.git = res
     if res:
         logger.info("Git: {0}".format(res))
     else:
         logger.info("Git: {0} (Git is needed, otherwise some dependency packages can't be installed.)".format(res))
 
+@tracing.traced("detect")
 def detect_vs():
     vs = []
     vs_2015_path = _registry_read(winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\WOW6432Node\Microsoft\VisualStudio\14.0",
@@ -95,10 +104,11 @@ def detect_vs():
     else:
         logger.info("Visual Studio: {0}".format(" ".join(vs)))
 
-def detect_cuda():
+@tracing.traced("detect")
+def detect_cuda(probe=None):
     if (SysInfo.os == TOOLSFORAI_OS_WIN or SysInfo.os == TOOLSFORAI_OS_LINUX):
         # return detect_cuda_()
-        status, stdout = _run_cmd("nvcc", ["-V"], True)
+        status, stdout = probe or _run_cmd("nvcc", ["-V"], True)
         if status and re.search(r"release\s*8.0,\s*V8.0", stdout):
             SysInfo.cuda = "8.0"
             logger.info("CUDA: {0}".format(SysInfo.cuda))
@@ -125,6 +135,7 @@ def detect_cuda():
     else:
         return True
 
+@tracing.traced("detect")
 def detect_cudnn():
     if (SysInfo.os == TOOLSFORAI_OS_WIN):
         detect_cudnn_win()
@@ -135,15 +146,102 @@ def detect_cudnn_win():
     else:
         required_cndunn = {'7': 'cudnn64_7.dll'}
     cmd = r"C:\Windows\System32\where.exe"
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(required_cndunn)) as executor:
+        probes = dict((version, executor.submit(_run_cmd, cmd, [dll], True)) for version, dll in required_cndunn.items())
     for version, dll in required_cndunn.items():
-        args = [dll]
-        status, cudnn = _run_cmd(cmd, args, True)
+        status, cudnn = probes[version].result()
         if status and next(filter(os.path.isfile, cudnn.split('\n')), None):
             SysInfo.cudnn = version
             logger.info("cuDNN: {0}".format(version))
     if not SysInfo.cudnn:
         logger.warning("Not detect cuDNN! We recommand cuDNN 7, please download and install cuDNN 7 from https://developer.nvidia.com/rdp/cudnn-download.")
 
+# Subprocess probes run concurrently, their results are then interpreted in the usual order so that the log
+# stays the same. A successful detection is saved with a fingerprint of everything the probes depend on.
+DETECT_SNAPSHOT_FIELDS = ["os", "python", "gpu", "cuda", "cudnn", "git"]
+
+def _detect_snapshot_path():
+    return os.path.sep.join([os.path.expanduser('~'), '.toolsforai', 'detect_snapshot.json'])
+
+def _detect_fingerprint():
+    import hashlib
+    import shutil
+    items = [sys.executable, os.environ.get("PATH", ""), str(SysInfo.cuda80), SysInfo.os]
+    for path in (_gpu_detector_path(), shutil.which("nvcc"), shutil.which("git")):
+        try:
+            items.append("{0}:{1}".format(path, os.path.getmtime(path)))
+        except (TypeError, OSError):
+            items.append("{0}:-".format(path))
+    return hashlib.sha256("\n".join(items).encode('utf-8')).hexdigest()
+
+def _load_detect_snapshot(fingerprint):
+    import json
+    try:
+        with open(_detect_snapshot_path()) as fin:
+            snapshot = json.load(fin)
+        if snapshot.get("fingerprint") == fingerprint:
+            return snapshot
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+def _save_detect_snapshot(fingerprint, gpu_name):
+    import json
+    snapshot = dict((field, getattr(SysInfo, field)) for field in DETECT_SNAPSHOT_FIELDS)
+    snapshot["fingerprint"] = fingerprint
+    snapshot["gpu_name"] = gpu_name
+    snapshot_path = _detect_snapshot_path()
+    try:
+        if not os.path.isdir(os.path.dirname(snapshot_path)):
+            os.makedirs(os.path.dirname(snapshot_path))
+        with open(snapshot_path + ".tmp", 'w') as fout:
+            json.dump(snapshot, fout, indent=2)
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+    except Exception as e:
+        logger.debug("Fail to save system detection snapshot, unexpected error: {0}".format(e))
+
+def _run_detect_probes():
+    import concurrent.futures
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        probes = {"git": executor.submit(_run_cmd, "git", ["--version"])}
+        if os.path.isfile(_gpu_detector_path()):
+            probes["gpu"] = executor.submit(_run_cmd, _gpu_detector_path(), return_stdout=True)
+        if SysInfo.os == TOOLSFORAI_OS_WIN or SysInfo.os == TOOLSFORAI_OS_LINUX:
+            # nvcc is probed speculatively, its result is only used when a GPU is found.
+            probes["nvcc"] = executor.submit(_run_cmd, "nvcc", ["-V"], True)
+    return dict((name, future.result()) for name, future in probes.items())
+
+@tracing.traced("detect")
+def detect_system(refresh=False):
+    if not detect_os() or not detect_python_version():
+        return False
+    fingerprint = _detect_fingerprint()
+    snapshot = None if refresh else _load_detect_snapshot(fingerprint)
+    if snapshot:
+        for field in DETECT_SNAPSHOT_FIELDS:
+            setattr(SysInfo, field, snapshot[field])
+        logger.info("NVIDIA GPU: {0}".format(snapshot["gpu_name"]))
+        logger.info("Git: {0}".format(SysInfo.git))
+        if SysInfo.gpu:
+            logger.info("CUDA: {0}".format(SysInfo.cuda))
+            if SysInfo.cudnn:
+                logger.info("cuDNN: {0}".format(SysInfo.cudnn))
+        logger.info("Use cached system information, run the installer script with '--refresh-detect' to detect again.")
+    else:
+        probes = _run_detect_probes()
+        if not detect_gpu(probes.get("gpu")):
+            return False
+        detect_git(probes["git"])
+        if (SysInfo.gpu):
+            if not detect_cuda(probes.get("nvcc")):
+                return False
+            detect_cudnn()
+        _save_detect_snapshot(fingerprint, probes["gpu"][1] if SysInfo.gpu else 'None')
+    if (SysInfo.os == TOOLSFORAI_OS_WIN):
+        detect_vs()
+    return True
+
 def detect_mpi_win():
     target_version = "7.0.12437.6"
     mpi_path = _registry_read(winreg.HKEY_LOCAL_MACHINE, r"Software\Microsoft\MPI", "InstallRoot")
@@ -160,8 +258,6 @@ def detect_mpi_win():
         return False
 
 def detect_visualcpp_runtime_win():
-    pattern = re.compile(
-        "(^Microsoft Visual C\+\+ 201(5|7) x64 Additional Runtime)|(^Microsoft Visual C\+\+ 201(5|7) x64 Minimum Runtime)")
     items = [(winreg.HKEY_CURRENT_USER, r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall"),
              (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\Microsoft\Windows\CurrentVersion\Uninstall"),
              (winreg.HKEY_LOCAL_MACHINE, r"SOFTWARE\WOW6432Node\Microsoft\Windows\CurrentVersion\Uninstall")]
@@ -170,7 +266,7 @@ def detect_visualcpp_runtime_win():
             current_key = winreg.OpenKey(hkey, keypath)
             for subkey in _registry_subkeys(hkey, keypath):
                 display_name = _registry_read(current_key, subkey, "DisplayName")
-                if (display_name and pattern.match(display_name)):
+                if (display_name and _VISUALCPP_RUNTIME_NAME.match(display_name)):
                     logger.info("Detect Visual C++ runtime already installed.")
                     return True
             winreg.CloseKey(current_key)
@@ -180,12 +276,99 @@ def detect_visualcpp_runtime_win():
     return False
 
 def module_exists(module_name):
+    # Import name check; use package_installed for distribution names.
     try:
-        from pkgutil import iter_modules
-        return module_name in (name for loader, name, ispkg in iter_modules())
+        import importlib.util
+        return importlib.util.find_spec(module_name) is not None
     except:
         return False
 
+def _canonical_dist_name(name):
+    return re.sub(r"[-_.]+", "-", name).lower()
+
+class InstalledIndex(object):
+    # Installed distributions by canonical name, read from the dist-info/egg-info directory names of every
+    # sys.path entry, or of paths, e.g. the sys.path of another interpreter. invalidate() rescans only the
+    # entries whose mtime changed since the last scan.
+    def __init__(self, paths=None):
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.versions = None
+        self.paths = paths
+
+    def _paths(self):
+        if self.paths is not None:
+            return list(dict.fromkeys(os.path.abspath(path) for path in self.paths if path and os.path.isdir(path)))
+        paths = [path for path in sys.path if path and os.path.isdir(path)]
+        try:
+            import site
+            if os.path.isdir(site.getusersitepackages()):
+                paths.append(site.getusersitepackages())
+        except Exception:
+            pass
+        return list(dict.fromkeys(os.path.abspath(path) for path in paths))
+
+    def _scan(self, path):
+        dists = {}
+        for entry in os.listdir(path):
+            if entry.endswith(".dist-info"):
+                stem = entry[:-len(".dist-info")]
+            elif entry.endswith(".egg-info"):
+                stem = entry[:-len(".egg-info")]
+            else:
+                continue
+            name, _, version = stem.partition("-")
+            version = version.split("-")[0]
+            if not version:
+                try:
+                    import importlib.metadata
+                    import pathlib
+                    distribution = importlib.metadata.PathDistribution(pathlib.Path(path, entry))
+                    name, version = distribution.metadata["Name"] or name, distribution.version
+                except Exception:
+                    pass
+            dists.setdefault(_canonical_dist_name(name), version)
+        return dists
+
+    def _rebuild(self):
+        versions = {}
+        entries = {}
+        for path in self._paths():
+            try:
+                mtime = os.path.getmtime(path)
+            except OSError:
+                continue
+            cached = self.entries.get(path)
+            if cached and cached[0] == mtime:
+                dists = cached[1]
+            else:
+                dists = self._scan(path)
+            entries[path] = (mtime, dists)
+            # Earlier sys.path entries shadow later ones, like imports do.
+            for name, version in dists.items():
+                versions.setdefault(name, version)
+        self.entries = entries
+        self.versions = versions
+
+    def invalidate(self):
+        with self.lock:
+            if self.versions is not None:
+                self._rebuild()
+
+    def version(self, name):
+        with self.lock:
+            if self.versions is None:
+                self._rebuild()
+            return self.versions.get(_canonical_dist_name(name))
+
+installed_index = InstalledIndex()
+
+def installed_version(name):
+    return installed_index.version(name)
+
+def package_installed(name):
+    return installed_index.version(name) is not None
+
 # read, write and delete registry
 def _registry_read(hkey, keypath, value_name):
     try:
@@ -229,30 +412,26 @@ def _registry_delete(hkey, keypath, name):
         return False
 
 # run cmd
-def _run_cmd(cmd, args=[], return_stdout=False):
-    try:
-        p = subprocess.run([cmd, *args], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
-        stdout = p.stdout.strip()
-        stderr = p.stderr.strip()
-        status = p.returncode == 0
-        logger.debug("========== {:^30} ==========".format("%s : stdout" % cmd))
-        for line in filter(lambda x: x.strip(), p.stdout.split('\n')):
-            logger.debug(line)
-        logger.debug("========== {:^30} ==========".format("%s : stdout end" % cmd))
-        logger.debug("========== {:^30} ==========".format("%s : stderr" % cmd))
-        for line in filter(lambda x: x.strip(), p.stderr.split('\n')):
-            logger.debug(line)
-        logger.debug("========== {:^30} ==========".format("%s : stderr end" % cmd))
-    except Exception as e:
-        logger.debug("Fail to execute command: {0}, unexpected error: {1}".format(cmd, e))
-        status = False
-        stdout = ""
-    if return_stdout:
-        return status, stdout
-    else:
-        return status
+def _run_cmd(cmd, args=[], return_stdout=False, timeout=None):
+    # Output is streamed into the debug log while the command runs, see runner.run.
+    import runner
+    with tracing.span(os.path.basename(cmd), "cmd", args=" ".join(map(str, args))) as event:
+        try:
+            result = runner.run(cmd, args, timeout)
+            stdout = "\n".join(result.stdout).strip()
+            status = result.returncode == 0 and not result.timed_out
+        except Exception as e:
+            logger.debug("Fail to execute command: {0}, unexpected error: {1}".format(cmd, e))
+            status = False
+            stdout = ""
+        event["status"] = status
+        if return_stdout:
+            return status, stdout
+        else:
+            return status
 
 def _wait_process(processHandle, timeout=-1):
+    import ctypes
     try:
         ret = ctypes.windll.kernel32.WaitForSingleObject(processHandle, timeout)
         logger.debug("Wait process return value: %d" % ret)
@@ -262,11 +441,12 @@ def _wait_process(processHandle, timeout=-1):
         ctypes.windll.kernel32.CloseHandle(processHandle)
 
 def _run_cmd_admin(cmd, param, wait=True):
+    import ctypes
     try:
-        executeInfo = ShellExecuteInfo(fMask=0x00000040, hwnd=None, lpVerb='runas'.encode('utf-8'),
-                                       lpFile=cmd.encode('utf-8'), lpParameters=param.encode('utf-8'),
-                                       lpDirectory=None,
-                                       nShow=5)
+        executeInfo = shell_execute_info(fMask=0x00000040, hwnd=None, lpVerb='runas'.encode('utf-8'),
+                                         lpFile=cmd.encode('utf-8'), lpParameters=param.encode('utf-8'),
+                                         lpDirectory=None,
+                                         nShow=5)
         if not ctypes.windll.shell32.ShellExecuteEx(ctypes.byref(executeInfo)):
             raise ctypes.WinError()
         if wait:
@@ -276,38 +456,354 @@ def _run_cmd_admin(cmd, param, wait=True):
         logger.error("Fail to run command {0} as admin, unexpected error! Please try to run installer script again!".format(cmd))
 
 # download, extract file
-def _download_file(url, local_path):
-    logger.info("Downloading {0} ...".format(url))
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_SEGMENT_MIN_SIZE = 64 * 1024 * 1024
+
+def _open_url(url, headers=None, method=None, timeout=60):
+    # Keep-alive connections shared by every download, see http_pool.
+    import http_pool
+    return http_pool.request(url, headers, method, timeout)
+
+class _DownloadProgress(object):
+    def __init__(self, url, total, done=0, interval=5.0):
+        self.url = url
+        self.total = total
+        self.done = done
+        self.received = 0
+        self.interval = interval
+        self.start = time.time()
+        self.last_report = self.start
+        self.lock = threading.Lock()
+
+    def update(self, size):
+        with self.lock:
+            self.done += size
+            self.received += size
+            now = time.time()
+            if now - self.last_report < self.interval:
+                return
+            self.last_report = now
+        self.report()
+
+    def throughput(self):
+        elapsed = max(time.time() - self.start, 1e-6)
+        return self.received / elapsed
+
+    def report(self):
+        speed = self.throughput() / (1024 * 1024)
+        if self.total:
+            logger.info("Downloading {0}: {1:.1f}/{2:.1f} MB ({3:.0%}), {4:.2f} MB/s".format(
+                self.url, self.done / (1024 * 1024), self.total / (1024 * 1024), self.done / self.total, speed))
+        else:
+            logger.info("Downloading {0}: {1:.1f} MB, {2:.2f} MB/s".format(self.url, self.done / (1024 * 1024), speed))
+
+class DigestMismatchError(IOError):
+    pass
+
+def _check_digest(url, digest, sha256):
+    # digest is the hashlib object fed while streaming, sha256 the expected hex digests, any of them matches.
+    if digest.hexdigest() not in sha256:
+        raise DigestMismatchError("sha256 of {0} is {1}, expected {2}".format(url, digest.hexdigest(), " or ".join(sha256)))
+
+def _copy_stream(fin, fout, progress, chunk_size, limit=None, digest=None):
+    # Copy in fixed-size chunks so memory stays bounded by chunk_size whatever the payload size.
+    while limit is None or limit > 0:
+        chunk = fin.read(chunk_size if limit is None else min(chunk_size, limit))
+        if not chunk:
+            break
+        fout.write(chunk)
+        if digest is not None:
+            digest.update(chunk)
+        progress.update(len(chunk))
+        if limit is not None:
+            limit -= len(chunk)
+    return limit
+
+def _probe_download(url):
+    # Returns (size, accept_ranges), size is None when the server does not tell.
     try:
-        import urllib.request
-        import ssl
-        myssl = ssl.create_default_context()
-        myssl.check_hostname = False
-        myssl.verify_mode = ssl.CERT_NONE
-        with urllib.request.urlopen(url, context=myssl) as fin, \
-                open(local_path, 'ab') as fout:
-            fout.write(fin.read())
-        return True
-    except:
-        logger.error("Fail to download {0}. Error: {1}".format(url, sys.exc_info()))
+        with _open_url(url, method="HEAD") as response:
+            size = response.headers.get("Content-Length")
+            accept_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+            return (int(size) if size else None), accept_ranges
+    except Exception as e:
+        logger.debug("Fail to probe {0}, unexpected error: {1}".format(url, e))
+        return None, False
+
+def _download_stream(url, part_path, progress, chunk_size, digest=None):
+    # Resume from an existing partial file through a Range request, restart if the server ignores it. digest is
+    # fed with the whole file: the resumed part from disk, the rest as it streams.
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    headers = {"Range": "bytes={0}-".format(offset)} if offset else {}
+    import http_pool
+    try:
+        response = _open_url(url, headers)
+    except http_pool.HTTPError as e:
+        if e.code != 416:
+            raise
+        # Range not satisfiable: the partial file is already complete or stale, start over.
+        os.remove(part_path)
+        offset = 0
+        response = _open_url(url)
+    with response:
+        if offset and response.status == 206:
+            logger.debug("Resume downloading {0} from byte {1}.".format(url, offset))
+            mode = 'ab'
+        else:
+            offset = 0
+            mode = 'wb'
+        progress.done = offset
+        length = response.headers.get("Content-Length")
+        if length and not progress.total:
+            progress.total = offset + int(length)
+        if digest is not None and offset:
+            with open(part_path, 'rb') as fin:
+                for chunk in iter(lambda: fin.read(chunk_size), b''):
+                    digest.update(chunk)
+        with open(part_path, mode) as fout:
+            _copy_stream(response, fout, progress, chunk_size, digest=digest)
+    if progress.total and os.path.getsize(part_path) != progress.total:
+        raise IOError("Incomplete download: got {0} of {1} bytes".format(os.path.getsize(part_path), progress.total))
+
+def _download_segment(url, part_path, start, end, progress, chunk_size, retries, backoff):
+    for attempt in range(retries + 1):
+        try:
+            with _open_url(url, {"Range": "bytes={0}-{1}".format(start, end)}) as response:
+                if response.status != 206:
+                    raise IOError("Server ignored range request for bytes {0}-{1}".format(start, end))
+                with open(part_path, 'r+b') as fout:
+                    fout.seek(start)
+                    try:
+                        _copy_stream(response, fout, progress, chunk_size, end - start + 1)
+                    finally:
+                        # A retry continues after what this segment already wrote.
+                        start = fout.tell()
+            if start <= end:
+                raise IOError("Incomplete segment: {0} bytes missing".format(end - start + 1))
+            return
+        except Exception as e:
+            if attempt == retries:
+                raise
+            logger.debug("Retry segment {0}-{1} of {2}, error: {3}".format(start, end, url, e))
+            time.sleep(backoff * (2 ** attempt))
+
+def _download_segments(url, part_path, size, segments, progress, chunk_size, retries, backoff):
+    import concurrent.futures
+    with open(part_path, 'wb') as fout:
+        fout.truncate(size)
+    segment_size = -(-size // segments)
+    ranges = [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=segments) as executor:
+        futures = [executor.submit(_download_segment, url, part_path, start, end, progress, chunk_size, retries, backoff)
+                   for start, end in ranges]
+        for future in futures:
+            future.result()
+
+def _download_file(url, local_path, chunk_size=DOWNLOAD_CHUNK_SIZE, retries=3, backoff=1.0, segments=1, sha256=()):
+    # sha256 are the expected hex digests. The file is hashed while it streams, so it is downloaded in one
+    # segment, and a mismatch fails at once without retrying.
+    with tracing.span("download", "download", url=url) as event:
+        logger.info("Downloading {0} ...".format(url))
+        part_path = local_path + ".part"
+        if sha256:
+            import hashlib
+            segments = 1
+        size, accept_ranges = _probe_download(url) if segments > 1 else (None, False)
+        progress = _DownloadProgress(url, size)
+        try:
+            if segments > 1 and accept_ranges and size and size >= DOWNLOAD_SEGMENT_MIN_SIZE:
+                logger.debug("Download {0} in {1} parallel segments.".format(url, segments))
+                _download_segments(url, part_path, size, segments, progress, chunk_size, retries, backoff)
+            else:
+                for attempt in range(retries + 1):
+                    digest = hashlib.sha256() if sha256 else None
+                    try:
+                        _download_stream(url, part_path, progress, chunk_size, digest)
+                        break
+                    except Exception as e:
+                        # Client errors such as 404 will not go away by retrying.
+                        if attempt == retries or 400 <= getattr(e, "code", 0) < 500:
+                            raise
+                        delay = backoff * (2 ** attempt)
+                        logger.warning("Fail to download {0}, retry in {1:.0f}s. Error: {2}".format(url, delay, e))
+                        time.sleep(delay)
+                if sha256:
+                    try:
+                        _check_digest(url, digest, sha256)
+                    except DigestMismatchError:
+                        os.remove(part_path)
+                        raise
+            os.replace(part_path, local_path)
+            progress.report()
+            return True
+        except:
+            logger.error("Fail to download {0}. Error: {1}".format(url, sys.exc_info()))
+            return False
+        finally:
+            event["bytes"] = progress.received
+            event["throughput"] = round(progress.throughput())
+
+DOWNLOAD_SPOOL_MAX_SIZE = 256 * 1024 * 1024
+
+class _ProgressReader(object):
+    # fout, when given, gets a copy of everything read.
+    def __init__(self, fin, progress, digest=None, fout=None):
+        self.fin = fin
+        self.progress = progress
+        self.digest = digest
+        self.fout = fout
+
+    def read(self, size=-1):
+        data = self.fin.read(size)
+        if self.digest is not None:
+            self.digest.update(data)
+        if self.fout is not None:
+            self.fout.write(data)
+        self.progress.update(len(data))
+        return data
+
+class _NullContext(object):
+    # contextlib.nullcontext is new in Python 3.7.
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc):
         return False
 
-def _unzip_file(file_path, target_dir):
+def _extract_all(archive, target_dir):
+    archive.extractall(target_dir)
+
+def _download_extract(url, target_dir, chunk_size=DOWNLOAD_CHUNK_SIZE, retries=3, backoff=1.0, sha256=(),
+                      extract=_extract_all, copy_path=None):
+    # Extract an archive while it downloads, without storing it on disk. A tar.gz is untarred straight from the
+    # response stream; a zip needs a seekable file, so it is spooled in memory (spilling to disk only above
+    # DOWNLOAD_SPOOL_MAX_SIZE) and extracted once the transfer completes. With the expected sha256, a zip is
+    # verified before it is extracted, a tar.gz when the stream ends, the caller removes what was extracted.
+    # extract(archive, target_dir) is called with the open ZipFile or streaming TarFile on every attempt.
+    # With copy_path, the archive is also written there while it streams, e.g. for the artifact cache, and
+    # removed on failure.
+    with tracing.span("download_extract", "download", url=url) as event:
+        logger.info("Downloading and extracting {0} to {1} ...".format(url, target_dir))
+        is_zip = url.lower().endswith(".zip")
+        for attempt in range(retries + 1):
+            try:
+                if not os.path.isdir(target_dir):
+                    os.makedirs(target_dir)
+                with _open_url(url) as response:
+                    length = response.headers.get("Content-Length")
+                    progress = _DownloadProgress(url, int(length) if length else None)
+                    digest = None
+                    if sha256:
+                        import hashlib
+                        digest = hashlib.sha256()
+                    if is_zip:
+                        import tempfile
+                        import zipfile
+                        with open(copy_path, 'w+b') if copy_path else \
+                                tempfile.SpooledTemporaryFile(max_size=DOWNLOAD_SPOOL_MAX_SIZE) as spool:
+                            _copy_stream(response, spool, progress, chunk_size, digest=digest)
+                            if sha256:
+                                _check_digest(url, digest, sha256)
+                            spool.seek(0)
+                            with zipfile.ZipFile(spool) as zip_file:
+                                extract(zip_file, target_dir)
+                    else:
+                        import tarfile
+                        with open(copy_path, 'wb') if copy_path else _NullContext() as fout:
+                            reader = _ProgressReader(response, progress, digest, fout)
+                            with tarfile.open(fileobj=reader, mode='r|gz', bufsize=chunk_size) as tar:
+                                extract(tar, target_dir)
+                            if sha256 or copy_path:
+                                # The tar end blocks and the gzip trailer may be left unread.
+                                while reader.read(chunk_size):
+                                    pass
+                        if sha256:
+                            _check_digest(url, digest, sha256)
+                progress.report()
+                event["bytes"] = progress.received
+                event["throughput"] = round(progress.throughput())
+                return True
+            except Exception as e:
+                if copy_path and os.path.isfile(copy_path):
+                    os.remove(copy_path)
+                # A stream cannot be resumed midway, retry the whole archive, extraction overwrites the partial tree.
+                if attempt == retries or 400 <= getattr(e, "code", 0) < 500 or isinstance(e, DigestMismatchError):
+                    logger.error("Fail to download and extract {0}. Error: {1}".format(url, sys.exc_info()))
+                    return False
+                delay = backoff * (2 ** attempt)
+                logger.warning("Fail to download and extract {0}, retry in {1:.0f}s. Error: {2}".format(url, delay, e))
+                time.sleep(delay)
+
+def _zip_member_path(name, target_dir):
+    # Same rules as ZipFile.extract: drop drive letters, absolute prefixes and '..' components.
+    parts = [part for part in re.split(r"[/\\]", os.path.splitdrive(name)[1]) if part not in ("", ".", "..")]
+    return os.path.join(target_dir, *parts) if parts else None
+
+def _partition_zip_members(infos, workers):
+    # Greedy balance by uncompressed size, largest members first.
+    buckets = [[] for _ in range(workers)]
+    loads = [0] * workers
+    for info in sorted(infos, key=lambda info: info.file_size, reverse=True):
+        i = loads.index(min(loads))
+        buckets[i].append(info)
+        loads[i] += info.file_size
+    return [bucket for bucket in buckets if bucket]
+
+def _unzip_members(file_path, target_dir, infos):
+    import shutil
+    import zipfile
+    with zipfile.ZipFile(file_path) as zip_file:
+        for info in infos:
+            member_path = _zip_member_path(info.filename, target_dir)
+            with zip_file.open(info) as fin, open(member_path, 'wb') as fout:
+                shutil.copyfileobj(fin, fout, DOWNLOAD_CHUNK_SIZE)
+            mode = (info.external_attr >> 16) & 0o7777
+            if mode and platform.system() != "Windows":
+                os.chmod(member_path, mode)
+
+@tracing.traced("extract")
+def _unzip_file(file_path, target_dir, workers=None):
+    # Members are partitioned across threads, each with its own ZipFile handle; zlib releases the GIL while
+    # decompressing. File objects share one position, so they are extracted by a single worker.
     logger.info("Unzipping {0} to {1} ...".format(file_path, target_dir))
     try:
+        import concurrent.futures
         import zipfile
+        if not isinstance(file_path, str):
+            workers = 1
+        elif not workers:
+            workers = os.cpu_count() or 1
         with zipfile.ZipFile(file_path) as zip_file:
-            if os.path.isdir(target_dir):
-                pass
+            infos = zip_file.infolist()
+        directories = set([target_dir])
+        files = []
+        for info in infos:
+            member_path = _zip_member_path(info.filename, target_dir)
+            if not member_path:
+                continue
+            # ZipInfo.is_dir() is new in Python 3.6.
+            if info.filename.endswith('/'):
+                directories.add(member_path)
             else:
-                os.makedirs(target_dir)
-            for names in zip_file.namelist():
-                zip_file.extract(names, target_dir)
+                directories.add(os.path.dirname(member_path))
+                files.append(info)
+        for directory in sorted(directories):
+            os.makedirs(directory, exist_ok=True)
+        partitions = _partition_zip_members(files, workers)
+        if len(partitions) <= 1:
+            for partition in partitions:
+                _unzip_members(file_path, target_dir, partition)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(partitions)) as executor:
+                for future in [executor.submit(_unzip_members, file_path, target_dir, partition)
+                               for partition in partitions]:
+                    future.result()
         return True
     except:
-        logger.error("Fail to unzip. Error: ", sys.exc_info())
+        logger.error("Fail to unzip. Error: {0}".format(sys.exc_info()))
         return False
 
+@tracing.traced("extract")
 def _extract_tar(file_path, target_dir):
     logger.info("Extracting {0} to {1} ...".format(file_path, target_dir))
     try:
@@ -315,7 +811,7 @@ def _extract_tar(file_path, target_dir):
         with tarfile.open(file_path) as tar:
             tar.extractall(path=target_dir)
     except:
-        logger.error("Fail to extract. Error: ", sys.exc_info())
+        logger.error("Fail to extract. Error: {0}".format(sys.exc_info()))
         return False
     return True
 
@@ -383,7 +879,6 @@ def fix_directory_ownership():
     set_ownership_as_login(target_dir)
 
 def rd_config():
+    import pkg_config
     config_path = os.path.join(os.path.dirname(os.path.realpath(__file__)), "config", "config.yaml")
-    with open(config_path) as f:
-        pkg_info = yaml.load(f)
-        return pkg_info
\ No newline at end of file
+    return pkg_config.load_config(config_path)
\ No newline at end of file